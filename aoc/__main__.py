@@ -0,0 +1,73 @@
+"""
+Run the solutions of a day on an input file or stdin, timing parsing and both parts separately, e.g.
+
+    python -m aoc 12 input.txt --repeat 10 --warmup 2
+
+The timings are written to stdout as JSON. With --profile DIR, every phase is profiled as well, see aoc.profiling.
+With --memory, the peak memory and top allocation sites of every phase are reported too, see aoc.memory.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any
+
+from aoc.profiling import PROFILE_ENV
+from aoc.runner import discover_days, load_day, run_day, to_json
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m aoc", description="Run and time the solutions of a day")
+    parser.add_argument("day", type=int, help="the day to run")
+    parser.add_argument("input", nargs="?", type=Path, help="the puzzle input file, read from stdin if omitted")
+    parser.add_argument("--repeat", type=int, default=1, help="how often each phase is timed")
+    parser.add_argument("--warmup", type=int, default=0, help="untimed runs of each phase before timing it")
+    parser.add_argument("--profile", type=Path, help="write cProfile stats and collapsed stacks to this directory")
+    parser.add_argument("--memory", action="store_true", help="report peak memory and top allocation sites")
+    args = parser.parse_args(argv)
+    if args.repeat < 1 or args.warmup < 0:
+        parser.error("--repeat needs to be at least 1, and --warmup can't be negative")
+
+    if args.profile is not None:  # needs to be set before the day is imported, see aoc.profiling
+        os.environ[PROFILE_ENV] = str(args.profile)
+
+    data = args.input.read_text() if args.input is not None else sys.stdin.read()
+    report = run_day(args.day, data, repeat=args.repeat, warmup=args.warmup)
+    if args.memory:  # measured separately, since tracing allocations slows everything down
+        # imported here, since aoc.memory imports days, which needs to happen after profiling is enabled
+        from aoc.memory import measure_day
+
+        report["memory_budget"] = getattr(load_day(args.day), "MEMORY_BUDGET", None)
+        for phase, usage in measure_day(args.day, data).items():
+            report["phases"][phase]["memory"] = usage.to_json()
+    json.dump(report, sys.stdout, default=to_json, indent=2)
+    sys.stdout.write("\n")
+
+
+def test_run_day(tmp_path: Path, capsys: Any) -> None:
+    assert discover_days()[1] == "aoc.day01"
+    (tmp_path / "input.txt").write_text("3   4\n4   3\n2   5\n1   3\n3   9\n3   3\n")
+    main(["1", str(tmp_path / "input.txt"), "--repeat", "3", "--warmup", "1", "--memory"])
+    report = json.loads(capsys.readouterr().out)
+    assert report["phases"]["part1"]["result"] == 11
+    assert report["phases"]["part2"]["result"] == 31
+    assert len(report["phases"]["parse"]["times"]) == 3
+    assert 0 < report["phases"]["part1"]["memory"]["peak"] <= report["memory_budget"]
+
+
+def test_profile_day(tmp_path: Path) -> None:
+    # a fresh interpreter, since profiling needs to be enabled before the day is imported
+    grid = "....#.....\n.........#\n..........\n..#.......\n.......#..\n..........\n.#..^.....\n........#.\n"
+    (tmp_path / "input.txt").write_text(grid + "#.........\n......#...\n")
+    command = [sys.executable, "-m", "aoc", "6", str(tmp_path / "input.txt"), "--profile", str(tmp_path / "profiles")]
+    report = json.loads(subprocess.run(command, capture_output=True, check=True, text=True).stdout)  # noqa: S603
+    assert report["phases"]["part2"]["result"] == 6
+    profiles = {path.name for path in (tmp_path / "profiles").iterdir()}
+    assert {f"aoc.day06.{phase}.prof" for phase in ("parse", "part1", "part2")} <= profiles
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""
+Benchmark the solutions on generated inputs of increasing size, to find out how they scale, e.g.
+
+    python -m aoc.benchmark --days 2 12 --scales 1 10 100 --output results.json --baseline baseline.json
+
+For every day, a seeded generator produces valid puzzle inputs at multiples of the size of the real puzzle input.
+Parsing and both parts are timed at every scale, and an empirical growth exponent k is fitted to time ~ size**k.
+Results are stored as JSON, and compared to a stored baseline to flag regressions.
+"""
+
+import argparse
+import json
+import sys
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any, TypeAlias
+
+import numpy as np
+import pytest
+
+from aoc.runner import PARTS, run_day
+
+Generator: TypeAlias = Callable[[np.random.Generator, int], str]
+
+SCALES = (1, 10, 100, 1000)
+PHASES = ("parse", *PARTS)
+# timings below this are dominated by noise, so they are never flagged as regressions
+MIN_SECONDS = 1e-3
+# by how much a growth exponent may increase before it is flagged as a regression
+EXPONENT_TOLERANCE = 0.25
+
+
+def grid_side(side: int, scale: int) -> int:
+    """The side length of a square grid with scale times as many cells as one with the given side length"""
+    return round(side * scale**0.5)
+
+
+def join_grid(grid: np.ndarray) -> str:
+    return "\n".join(row.tobytes().decode() for row in grid)
+
+
+def generate_day01(rng: np.random.Generator, scale: int) -> str:
+    a = rng.integers(10000, 100000, 1000 * scale)
+    # about half of the right list also appears in the left one, so similarity scores aren't all 0
+    b = np.where(rng.random(len(a)) < 0.5, rng.choice(a, len(a)), rng.integers(10000, 100000, len(a)))
+    return "\n".join(map("{}   {}".format, a.tolist(), b.tolist()))
+
+
+def generate_day02(rng: np.random.Generator, scale: int) -> str:
+    reports = []
+    for _ in range(1000 * scale):
+        steps = rng.choice([-1, 1]) * rng.integers(1, 4, rng.integers(4, 8))
+        if rng.random() < 0.4:  # make some reports unsafe, by a step which is too large, zero or in the wrong direction
+            steps[rng.integers(len(steps))] = rng.choice([0, 4, 5, -steps[0]])
+        levels = rng.integers(30, 70) + np.concatenate([[0], np.cumsum(steps)])
+        reports.append(" ".join(map(str, levels.tolist())))
+    return "\n".join(reports)
+
+
+def generate_day03(rng: np.random.Generator, scale: int) -> str:
+    junk = list("!@#$%^&*()[]{}<>,;:' whymulfrom")
+    pieces = []
+    for _ in range(700 * scale):
+        a, b = rng.integers(1, 1000, 2).tolist()
+        kind = rng.integers(6)
+        if kind == 0:
+            pieces.append(f"mul({a},{b})")
+        elif kind == 1:  # corrupted instructions
+            pieces.append(str(rng.choice([f"mul({a}, {b})", f"mul[{a},{b}]", f"mul({a},{b}", f"mul ( {a},{b})"])))
+        elif kind == 2:
+            pieces.append(str(rng.choice(["do()", "don't()"])))
+        else:
+            pieces.append("".join(rng.choice(junk, rng.integers(1, 12)).tolist()))
+    return "".join(pieces)
+
+
+def generate_day04(rng: np.random.Generator, scale: int) -> str:
+    side = grid_side(140, scale)
+    return join_grid(rng.choice(np.frombuffer(b"XMAS", dtype=np.uint8), (side, side)))
+
+
+def generate_day05(rng: np.random.Generator, scale: int) -> str:
+    # rules between all pairs of pages, in an order consistent with a random permutation of them
+    order = rng.choice(np.arange(10, 100), 49, replace=False)
+    rules = [f"{order[i]}|{order[j]}" for i in range(len(order)) for j in range(i + 1, len(order))]
+    rules = [rules[i] for i in rng.permutation(len(rules))]
+
+    updates = []
+    rank = {page: i for i, page in enumerate(order.tolist())}
+    for _ in range(200 * scale):
+        pages = rng.choice(order, 2 * rng.integers(2, 12) + 1, replace=False).tolist()
+        if rng.random() < 0.5:  # about half of the updates are in the right order
+            pages.sort(key=rank.__getitem__)
+        updates.append(",".join(map(str, pages)))
+    return "\n".join(rules) + "\n\n" + "\n".join(updates)
+
+
+# the directions of the guard, in the order it turns in, starting upwards
+GUARD_DIRECTIONS = [(-1, 0), (0, 1), (1, 0), (0, -1)]
+
+
+def guard_ray(grid: np.ndarray, seen: np.ndarray, y: int, x: int, direction: int) -> tuple[np.ndarray, np.ndarray, int]:
+    """The cells in front of the guard up to the border, and how far it can walk without an obstacle or loop"""
+    dy, dx = GUARD_DIRECTIONS[direction]
+    ahead = np.arange(1, (y, len(grid) - 1 - x, len(grid) - 1 - y, x)[direction] + 1)
+    ys, xs = y + dy * ahead, x + dx * ahead
+    blocked = (grid[ys, xs] == ord("#")) | seen[direction, ys, xs]
+    return ys, xs, int(blocked.argmax()) if blocked.any() else len(ahead)
+
+
+def guard_path_grid(rng: np.random.Generator, side: int, target: int, lookahead: int = 8) -> np.ndarray:
+    """
+    Lay out the path of the guard through a grid of sparse random obstacles, placing an obstacle wherever it should
+    turn right next, until it visited the target number of cells and can leave the grid.
+
+    Obstacles are never placed on cells the guard visited, so it actually walks the path laid out, and it never walks a
+    cell in a direction it walked it in before, which would mean it is in a loop. Paths turning right all the time tend
+    to spiral into a dead end, so out of a few random places to turn, the one with the most room after turning is used.
+    If the path does end up in a dead end, it is cut short where the guard could last walk straight out of the grid,
+    by removing all obstacles placed after that point, which the path up to there never touched.
+    """
+    grid = np.where(rng.random((side, side)) < 0.01, ord("#"), ord(".")).astype(np.uint8)
+    seen = np.zeros((4, side, side), dtype=bool)  # seen[direction, y, x] is True if the guard was there facing that way
+    y, x = rng.integers(side // 4, 3 * side // 4, size=2).tolist()
+    grid[y, x] = ord("^")
+    direction, visited = 0, 1
+    placed: list[tuple[int, int]] = []
+    leave_at = 0  # how many obstacles were placed when the guard could last have left the grid
+    while not seen[direction, y, x]:
+        seen[direction, y, x] = True
+        ys, xs, free = guard_ray(grid, seen, y, x, direction)
+        if free == len(ys):  # nothing in the way, so the guard could leave the grid from here
+            if visited >= target:
+                return grid
+            leave_at = len(placed)
+        turned = (direction + 1) % len(GUARD_DIRECTIONS)
+        if free == 0 and len(ys) > 0 and grid[ys[0], xs[0]] == ord("#"):  # turn right away
+            direction = turned
+            continue
+
+        # the guard can stop after walking k cells if we can place an obstacle in front of it, or there is one already
+        stops = np.flatnonzero(~seen[:, ys[1:free], xs[1:free]].any(axis=0)) + 1
+        if free < len(ys) and grid[ys[free], xs[free]] == ord("#"):
+            stops = np.append(stops, free)
+        stops = stops[~seen[turned, ys[stops - 1], xs[stops - 1]]]  # after turning, it needs to go somewhere new
+        if len(stops) == 0:
+            break
+        candidates = rng.choice(stops, min(lookahead, len(stops)), replace=False)
+        rays = [guard_ray(grid, seen, int(ys[k - 1]), int(xs[k - 1]), turned) for k in candidates]
+        room = [
+            ray_free + (side if visited >= target and ray_free == len(ray_ys) else 0) for ray_ys, _, ray_free in rays
+        ]
+        walked = int(candidates[np.argmax(room)])
+
+        visited += np.count_nonzero(~seen[:, ys[:walked], xs[:walked]].any(axis=0))
+        seen[direction, ys[:walked], xs[:walked]] = True
+        if walked < free:
+            obstacle = int(ys[walked]), int(xs[walked])
+            grid[obstacle] = ord("#")
+            placed.append(obstacle)
+        y, x, direction = int(ys[walked - 1]), int(xs[walked - 1]), turned
+
+    for obstacle in placed[leave_at:]:
+        grid[obstacle] = ord(".")
+    return grid
+
+
+def generate_day06(rng: np.random.Generator, scale: int) -> str:
+    # imported here, so importing this module doesn't import day06 before profiling is enabled, see aoc.profiling
+    from aoc import day06
+
+    # random obstacles alone make the guard leave after a few dozen steps, while it visits about a third of the cells
+    # of an actual puzzle input, so we lay out such a path and reject grids where it falls far short of that
+    side = grid_side(130, scale)
+    while True:
+        data = join_grid(guard_path_grid(rng, side, side * side // 3))
+        puzzle_input = day06.parse(data)
+        start_pos, start_direction, obstructions, _ = puzzle_input
+        if day06.contains_loop(start_pos, start_direction, day06.ObstacleIndex(obstructions)):
+            continue
+        if day06.part1(*puzzle_input, backend="array") >= side * side // 10:
+            return data
+
+
+def generate_day10(rng: np.random.Generator, scale: int) -> str:
+    # the grid is made up of blocks, each with a summit somewhere, from which the height decreases in all directions
+    side, block = grid_side(45, scale), 20
+    y, x = np.indices((side, side))
+    peaks_y, peaks_x = rng.integers(block, size=(2, side // block + 1, side // block + 1))
+    distance = np.abs(y % block - peaks_y[y // block, x // block]) + np.abs(x % block - peaks_x[y // block, x // block])
+    topo = (9 - distance - rng.integers(0, 2, (side, side))) % 10
+    return "\n".join("".join(map(str, row)) for row in topo.tolist())
+
+
+def generate_day11(rng: np.random.Generator, scale: int) -> str:
+    return " ".join(map(str, rng.integers(0, 10**7, 8 * scale).tolist()))
+
+
+def generate_day12(rng: np.random.Generator, scale: int) -> str:
+    # blocks of the same plant, with some single plants scattered all over
+    side, block = grid_side(140, scale), 6
+    plants = np.frombuffer(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ", dtype=np.uint8)
+    blocks = rng.choice(plants, (side // block + 1, side // block + 1))
+    garden = np.repeat(np.repeat(blocks, block, axis=0), block, axis=1)[:side, :side]
+    garden = np.where(rng.random((side, side)) < 0.15, rng.choice(plants, (side, side)), garden)
+    return join_grid(garden)
+
+
+def generate_day13(rng: np.random.Generator, scale: int) -> str:
+    machines = []
+    for _ in range(320 * scale):
+        (ax, ay), (bx, by) = rng.integers(10, 100, (2, 2)).tolist()
+        if rng.random() < 0.5:  # about half of the prizes can be won
+            a, b = rng.integers(1, 100, 2).tolist()
+            px, py = a * ax + b * bx, a * ay + b * by
+        else:
+            px, py = rng.integers(1000, 20000, 2).tolist()
+        machines.append(f"Button A: X+{ax}, Y+{ay}\nButton B: X+{bx}, Y+{by}\nPrize: X={px}, Y={py}")
+    return "\n\n".join(machines)
+
+
+GENERATORS: dict[int, Generator] = {
+    1: generate_day01,
+    2: generate_day02,
+    3: generate_day03,
+    4: generate_day04,
+    5: generate_day05,
+    6: generate_day06,
+    10: generate_day10,
+    11: generate_day11,
+    12: generate_day12,
+    13: generate_day13,
+}
+
+
+def fit_exponent(sizes: list[int], times: list[float]) -> float | None:
+    """Fit the growth exponent k of time ~ size**k, as the slope of a line through the log-log points"""
+    if len(sizes) < 2:
+        return None
+    slope, _ = np.polyfit(np.log(sizes), np.log(np.maximum(times, 1e-9)), 1)
+    return float(slope)
+
+
+def benchmark_day(
+    day: int, scales: tuple[int, ...] = SCALES, seed: int = 0, repeat: int = 1, budget: float = 10
+) -> dict[str, Any]:
+    """
+    Time a day at all given scales, stopping before larger scales once any phase took longer than the given budget
+    in seconds at a scale
+
+    Returns:
+        The input size in bytes per scale, and the fastest time per scale together with the growth exponent per phase
+    """
+    sizes: dict[str, int] = {}
+    times: dict[str, dict[str, float]] = {phase: {} for phase in PHASES}
+    for scale in scales:
+        data = GENERATORS[day](np.random.default_rng(seed), scale)
+        report = run_day(day, data, repeat=repeat)
+        sizes[str(scale)] = len(data)
+        for phase in PHASES:
+            times[phase][str(scale)] = report["phases"][phase]["min"]
+        if max(times[phase][str(scale)] for phase in PHASES) > budget:
+            break
+
+    phases = {
+        phase: {
+            "times": phase_times,
+            "exponent": fit_exponent([sizes[scale] for scale in phase_times], list(phase_times.values())),
+        }
+        for phase, phase_times in times.items()
+    }
+    return {"sizes": sizes, "phases": phases}
+
+
+def find_regressions(results: dict[str, Any], baseline: dict[str, Any], tolerance: float) -> list[str]:
+    """
+    Compare benchmark results with a baseline: a phase regressed if it got slower by more than the given relative
+    tolerance at any scale, or if its growth exponent increased by more than EXPONENT_TOLERANCE
+    """
+    regressions = []
+    for day, day_results in results["days"].items():
+        for phase, result in day_results["phases"].items():
+            base = baseline.get("days", {}).get(day, {}).get("phases", {}).get(phase)
+            if base is None:
+                continue
+            for scale, seconds in result["times"].items():
+                base_seconds = base["times"].get(scale)
+                if base_seconds is not None and seconds > max(base_seconds * (1 + tolerance), MIN_SECONDS):
+                    regressions.append(
+                        f"day {day} {phase} at scale {scale}: {seconds:.4f}s, baseline {base_seconds:.4f}s"
+                    )
+            exponent, base_exponent = result["exponent"], base["exponent"]
+            if exponent is not None and base_exponent is not None and exponent > base_exponent + EXPONENT_TOLERANCE:
+                regressions.append(f"day {day} {phase}: growth exponent {exponent:.2f}, baseline {base_exponent:.2f}")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m aoc.benchmark", description="Benchmark the solutions at scale")
+    parser.add_argument("--days", type=int, nargs="+", default=sorted(GENERATORS), help="the days to benchmark")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(SCALES), help="input size multipliers")
+    parser.add_argument("--seed", type=int, default=0, help="seed for generating the inputs")
+    parser.add_argument("--repeat", type=int, default=1, help="how often each phase is timed, keeping the fastest")
+    parser.add_argument("--budget", type=float, default=10, help="skip larger scales once a phase takes this long")
+    parser.add_argument("--output", type=Path, help="where to store the results, written to stdout if omitted")
+    parser.add_argument("--baseline", type=Path, help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="relative slowdown flagged as a regression")
+    args = parser.parse_args(argv)
+    if unknown := sorted(set(args.days) - set(GENERATORS)):
+        parser.error(f"no input generator for days {unknown}")
+
+    scales = tuple(sorted(args.scales))
+    results: dict[str, Any] = {"seed": args.seed, "repeat": args.repeat, "scales": scales, "days": {}}
+    for day in args.days:
+        results["days"][str(day)] = benchmark_day(day, scales, args.seed, args.repeat, args.budget)
+    if args.baseline is not None:
+        results["regressions"] = find_regressions(results, json.loads(args.baseline.read_text()), args.tolerance)
+
+    output = json.dumps(results, indent=2)
+    if args.output is not None:
+        args.output.write_text(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+    for regression in results.get("regressions", []):
+        sys.stderr.write(f"regression: {regression}\n")
+    return 1 if results.get("regressions") else 0
+
+
+@pytest.mark.parametrize("day", sorted(GENERATORS))
+def test_generators(day: int) -> None:
+    data = GENERATORS[day](np.random.default_rng(0), 1)
+    assert data == GENERATORS[day](np.random.default_rng(0), 1)
+    assert len(GENERATORS[day](np.random.default_rng(0), 10)) > 5 * len(data)
+    run_day(day, data)
+
+
+def test_guard_path() -> None:
+    from aoc import day06
+
+    # like in an actual puzzle input, the guard walks a long way, with many places for an obstruction to make it loop
+    puzzle_input = day06.parse(generate_day06(np.random.default_rng(0), 1))
+    assert day06.part1(*puzzle_input) >= 130 * 130 // 10
+    assert day06.part2(*puzzle_input) > 100
+
+
+def test_regressions() -> None:
+    assert fit_exponent([10, 100, 1000], [0.1, 1.0, 10.0]) == pytest.approx(1)
+    baseline = {"days": {"1": {"phases": {"part1": {"times": {"1": 0.1, "10": 1.0}, "exponent": 1.0}}}}}
+    results = {"days": {"1": {"phases": {"part1": {"times": {"1": 0.1, "10": 10.0}, "exponent": 2.0}}}}}
+    assert len(find_regressions(results, baseline, 0.25)) == 2
+    assert find_regressions(baseline, baseline, 0.25) == []
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,18 +4,24 @@ import numpy as np
 import pytest
 from aocd.models import Puzzle
 
+from aoc.grid import load_grid
+from aoc.profiling import profiled
+
 PuzzleInput: TypeAlias = np.ndarray
 
 
+@profiled
 def parse(data: str) -> PuzzleInput:
-    return np.array([list(l) for l in data.strip().splitlines()])
+    return load_grid(data)
 
 
+@profiled
 def part1(data: PuzzleInput) -> int:
     _ = data
     return 1
 
 
+@profiled
 def part2(data: PuzzleInput) -> int:
     _ = data
     return 2
@@ -1,28 +1,62 @@
-import re
-from collections import Counter
 from typing import TypeAlias
 
 import numpy as np
 import pytest
 from aocd.models import Puzzle
 
+from aoc.parsing import extract_int_table
+from aoc.profiling import profiled
+
+MEMORY_BUDGET = 8 << 20
+
 PuzzleInput: TypeAlias = tuple[np.ndarray, np.ndarray]
 
+# location ids spanning more values than this are not worth a histogram, we fall back to comparison sorts instead
+MAX_HISTOGRAM_RANGE = 1 << 24
+
 
+@profiled
 def parse(data: str) -> PuzzleInput:
-    nums = np.array([list(map(int, re.findall(r"\d+", line))) for line in data.strip().splitlines()])
+    nums = extract_int_table(data)
     return nums[:, 0], nums[:, 1]
 
 
+def histograms(a: np.ndarray, b: np.ndarray) -> tuple[int, np.ndarray, np.ndarray] | None:
+    """
+    Count how often every location id occurs in both lists
+
+    Returns:
+        The smallest location id and the two histograms starting at that id, or None if the ids span too large a range
+    """
+    low = int(min(a.min(), b.min()))
+    size = int(max(a.max(), b.max())) - low + 1
+    if size > MAX_HISTOGRAM_RANGE:
+        return None
+    return low, np.bincount(a - low, minlength=size), np.bincount(b - low, minlength=size)
+
+
+@profiled
 def part1(a: np.ndarray, b: np.ndarray) -> int:
-    a.sort()
-    b.sort()
-    return np.abs(a - b).sum()
+    counts = histograms(a, b)
+    if counts is None:
+        return int(np.abs(np.sort(a) - np.sort(b)).sum())
 
+    # instead of materializing both sorted lists, we use that sum(|sorted_a - sorted_b|) equals the number of
+    # thresholds t each pair lies across, which is |#(a <= t) - #(b <= t)| summed over all thresholds t
+    _, counts_a, counts_b = counts
+    return int(np.abs(np.cumsum(counts_a - counts_b)[:-1]).sum())
 
+
+@profiled
 def part2(a: np.ndarray, b: np.ndarray) -> int:
-    occurrences = Counter(b)
-    return sum(val * occurrences[val] for val in a)
+    counts = histograms(a, b)
+    if counts is None:
+        values, occurrences = np.unique(b, return_counts=True)
+        indices = np.searchsorted(values, a).clip(max=len(values) - 1)
+        return int(np.dot(a, np.where(values[indices] == a, occurrences[indices], 0)))
+
+    low, counts_a, counts_b = counts
+    return int(np.dot(np.arange(low, low + len(counts_a)) * counts_a, counts_b))
 
 
 @pytest.fixture
@@ -58,3 +92,17 @@ def test_part2(puzzle_input: PuzzleInput) -> None:
 
 def test_example_part2(example_input: PuzzleInput) -> None:
     assert part2(*example_input) == 31
+
+
+@pytest.mark.parametrize("id_range", [100_000, 1 << 40])
+def test_histogram_and_sort_paths_agree(id_range: int) -> None:
+    rng = np.random.default_rng(1)
+    a, b = rng.integers(0, id_range, size=(2, 1000))
+    b[::3] = a[::3]  # make sure there are some location ids occurring in both lists
+    a_before, b_before = a.copy(), b.copy()
+
+    assert part1(a, b) == np.abs(np.sort(a) - np.sort(b)).sum()
+    assert part2(a, b) == sum(int(val) * int((b == val).sum()) for val in a)
+    # our inputs are not sorted in place
+    assert np.array_equal(a, a_before)
+    assert np.array_equal(b, b_before)
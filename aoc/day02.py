@@ -1,40 +1,102 @@
-import re
+from dataclasses import dataclass
 from typing import TypeAlias
 
 import numpy as np
 import pytest
 from aocd.models import Puzzle
 
-PuzzleInput: TypeAlias = list[np.ndarray]
+from aoc.parsing import extract_int_rows
+from aoc.profiling import profiled
 
 
+@dataclass(frozen=True)
+class Reports:
+    """All reports in CSR layout: the levels of report i are values[offsets[i] : offsets[i + 1]]"""
+
+    values: np.ndarray
+    offsets: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        return self.values[self.offsets[i] : self.offsets[i + 1]]
+
+
+MEMORY_BUDGET = 2 << 20
+
+PuzzleInput: TypeAlias = Reports
+
+
+@profiled
 def parse(data: str) -> PuzzleInput:
-    return [np.asarray(list(map(int, re.findall(r"\d+", line)))) for line in data.strip().splitlines()]
+    values, offsets = extract_int_rows(data)
+    # blank lines are not reports, so drop the empty rows they result in
+    return Reports(values, np.concatenate([offsets[:1], offsets[1:][np.diff(offsets) > 0]]))
+
+
+def not_allowed(differences: np.ndarray) -> np.ndarray:
+    """
+    Check which level differences are not allowed, for both an increasing (row 0) and a decreasing (row 1) report.
+    We need level increases or decreases of minimum 1 and maximum 3.
+    """
+    directed = differences * np.array([[1], [-1]])
+    return (directed < 1) | (directed > 3)
+
 
+def count_not_allowed(differences: np.ndarray) -> np.ndarray:
+    """
+    Cumulative count of not allowed differences, of shape (2, len(differences) + 1). This allows us to count the
+    not allowed differences between the levels i and j of a report in constant time: counts[:, j] - counts[:, i]
+    """
+    return np.pad(np.cumsum(not_allowed(differences), axis=1), ((0, 0), (1, 0)))
 
-def is_safe(report: np.ndarray) -> bool | np.bool:
-    differences = np.diff(report)
-    # check we have level increases or decreases of minimum 1 and maximum 3
-    if np.abs(differences).max() > 3 or np.abs(differences).min() < 1:
-        return False
 
-    # check if the report is monotonic
-    return np.all(differences >= 0) or np.all(differences <= 0)
+def safe_reports(reports: Reports) -> np.ndarray:
+    """Check all reports at once, returning a boolean array indicating which reports are safe"""
+    # one diff over all values, the differences across two reports are never looked at
+    bad = count_not_allowed(np.diff(reports.values))
+    starts, ends = reports.offsets[:-1], np.maximum(reports.offsets[1:] - 1, reports.offsets[:-1])
+    # empty reports are not safe, just like in safe_reports_with_removal, where they have no level to remove
+    return ((bad[:, ends] - bad[:, starts]) == 0).any(axis=0) & (reports.offsets[1:] > reports.offsets[:-1])
 
 
+@profiled
 def part1(reports: PuzzleInput) -> int:
-    return sum(1 if is_safe(report) else 0 for report in reports)
+    return int(safe_reports(reports).sum())
 
 
-def is_safe_with_removals(report: np.ndarray) -> bool:
-    if is_safe(report):
-        return True
+def safe_reports_with_removal(reports: Reports) -> np.ndarray:
+    """
+    Check which reports are safe if we are allowed to remove at most one level from them.
 
-    return any(is_safe(np.concat((report[:i], report[i + 1 :]))) for i in range(len(report)))
+    Instead of trying all removals, we check for every level at once whether all differences before it
+    (a forward scan) and after it (a backward scan) are fine, and whether the difference bridging the removed level is.
+    """
+    values, offsets = reports.values, reports.offsets
+    bad = count_not_allowed(np.diff(values))
 
+    lengths = np.diff(offsets)
+    report = np.repeat(np.arange(len(reports)), lengths)  # which report each level belongs to
+    start, end = offsets[report], offsets[report + 1]  # first level and one past the last level of the report
+    i = np.arange(len(values))  # the level we are trying to remove
 
+    # differences before the removed level are the ones between levels start..i-1
+    bad_before = bad[:, np.maximum(i - 1, start)] - bad[:, start]
+    # differences after the removed level are the ones between levels i+1..end-1
+    bad_after = bad[:, end - 1] - bad[:, np.minimum(i + 1, end - 1)]
+    # and removing a level in the middle introduces a new difference between its two neighbours
+    inner = (i > start) & (i < end - 1)
+    bridge = values[np.minimum(i + 1, len(values) - 1)] - values[np.maximum(i - 1, 0)]
+    bridge_ok = ~(inner & not_allowed(bridge))
+
+    removable = ((bad_before == 0) & (bad_after == 0) & bridge_ok).any(axis=0)
+    return np.bincount(report, weights=removable, minlength=len(reports)) > 0
+
+
+@profiled
 def part2(reports: PuzzleInput) -> int:
-    return sum(1 if is_safe_with_removals(report) else 0 for report in reports)
+    return int(safe_reports_with_removal(reports).sum())
 
 
 @pytest.fixture
@@ -70,3 +132,26 @@ def test_part2(puzzle_input: PuzzleInput) -> None:
 
 def test_example_part2(example_input: PuzzleInput) -> None:
     assert part2(example_input) == 4
+
+
+def test_single_removal_matches_brute_force() -> None:
+    rng = np.random.default_rng(2)
+    reports = [np.cumsum(rng.integers(-4, 5, size=rng.integers(1, 9))) for _ in range(2000)]
+    data = "\n".join(" ".join(map(str, report + 100)) for report in reports)
+
+    def is_safe(report: np.ndarray) -> bool:
+        return not not_allowed(np.diff(report)).any(axis=1).all()
+
+    def brute_force(report: np.ndarray) -> bool:
+        return is_safe(report) or any(is_safe(np.delete(report, i)) for i in range(len(report)))
+
+    assert safe_reports(parse(data)).tolist() == [is_safe(report) for report in reports]
+    assert safe_reports_with_removal(parse(data)).tolist() == [brute_force(report) for report in reports]
+
+
+def test_blank_lines() -> None:
+    reports = parse("\n7 6 4 2 1\n\n1 2 7 8 9\n")
+    assert len(reports) == 2
+    assert (part1(reports), part2(reports)) == (1, 1)
+    assert safe_reports(Reports(np.array([1, 2]), np.array([0, 0, 2]))).tolist() == [False, True]
+    assert safe_reports(parse("5\n1 2 3")).tolist() == [True, True]
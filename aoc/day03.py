@@ -1,50 +1,209 @@
+import mmap
 import re
+from collections.abc import Buffer, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import reduce
+from itertools import repeat
+from operator import add
+from pathlib import Path
 from typing import TypeAlias
 
 import pytest
 from aocd.models import Puzzle
 
-Instructions: TypeAlias = list[str]
+from aoc.profiling import profiled
 
+MEMORY_BUDGET = 1 << 20
 
-def parse(data: str) -> Instructions:
-    return list(re.findall(r"mul\(\d+,\d+\)|don't\(\)|do\(\)", data))
+# instructions take 1-3 digit numbers, which bounds how long an instruction can be
+INSTRUCTION = re.compile(rb"mul\((\d{1,3}),(\d{1,3})\)|(do\(\))|(don't\(\))")
+MAX_INSTRUCTION_LENGTH = len(b"mul(123,456)")
+DO, DONT = 3, 4  # the regex groups of the do() and don't() instructions
 
+CorruptedMemory: TypeAlias = Buffer
 
-def evaluate(multiplication: str) -> int:
-    m = re.match(r"mul\((\d+),(\d+)\)", multiplication)
-    if not m:
-        raise ValueError(f"Invalid input: {multiplication}")
-    return int(m.group(1)) * int(m.group(2))
 
+@profiled
+def parse(data: str) -> CorruptedMemory:
+    return data.encode()
 
-def part1(instructions: Instructions) -> int:
-    return sum(evaluate(instruction) for instruction in instructions if instruction.startswith("mul"))
 
+def number(buffer: Buffer, start: int, end: int) -> int:
+    """Parse the decimal number in buffer[start:end], without creating an intermediate bytes object"""
+    memory = memoryview(buffer)
+    value = 0
+    for i in range(start, end):
+        value = value * 10 + memory[i] - ord("0")
+    return value
 
-def part2(instructions: Instructions) -> int:
-    enabled = True
-    total = 0
-    for instruction in instructions:
-        match instruction:
-            case "do()":
-                enabled = True
-            case "don't()":
-                enabled = False
-            case _:
-                if enabled:
-                    total += evaluate(instruction)
 
-    return total
+@dataclass
+class Scanner:
+    """Scans corrupted memory in one pass and in chunks, keeping track of the totals for both parts along the way"""
+
+    total: int = 0  # sum of all multiplications
+    enabled_total: int = 0  # sum of all multiplications that are enabled
+    enabled: bool = True
+    tail: bytes = b""  # the end of the previous chunk, which might contain the start of an instruction
+
+    def scan(self, buffer: Buffer, stop: int) -> int:
+        """
+        Evaluate all instructions starting before the given stop position in the buffer
+
+        Returns:
+            The position at which scanning needs to be continued
+        """
+        resume_at = 0
+        for m in INSTRUCTION.finditer(buffer):
+            if m.start() >= stop:
+                break
+            resume_at = m.end()
+            if m.lastindex == DO:
+                self.enabled = True
+            elif m.lastindex == DONT:
+                self.enabled = False
+            else:
+                product = number(buffer, *m.span(1)) * number(buffer, *m.span(2))
+                self.total += product
+                if self.enabled:
+                    self.enabled_total += product
+        return max(resume_at, stop)
+
+    def feed(self, chunk: Buffer) -> None:
+        """Scan the next chunk of memory, an instruction may be split across two chunks"""
+        buffer = self.tail + bytes(chunk)
+        # instructions starting this close to the end might continue in the next chunk, so we scan them later
+        stop = max(len(buffer) - MAX_INSTRUCTION_LENGTH + 1, 0)
+        self.tail = buffer[self.scan(buffer, stop) :]
+
+    def finish(self) -> "Scanner":
+        """Scan the remaining memory after the last chunk"""
+        self.scan(self.tail, len(self.tail))
+        self.tail = b""
+        return self
+
+
+def scan(memory: Buffer | Iterable[Buffer]) -> Scanner:
+    """Scan either a single buffer (e.g. bytes or a mmap) or an iterable of chunks, such as a file reader"""
+    scanner = Scanner()
+    if isinstance(memory, Buffer):
+        scanner.scan(memory, len(memoryview(memory)))
+        return scanner
+
+    for chunk in memory:
+        scanner.feed(chunk)
+    return scanner.finish()
+
+
+def scan_file(path: Path, chunk_size: int = 1 << 20) -> Scanner:
+    """Scan a file of corrupted memory in constant memory, by reading it chunk by chunk"""
+    with path.open("rb") as f:
+        return scan(iter(lambda: f.read(chunk_size), b""))
+
+
+@dataclass(frozen=True)
+class ChunkSummary:
+    """
+    Summary of a chunk of memory, which can be computed independently of all other chunks. Since the enabled state at
+    the start of a chunk is not known in advance, we keep track of the enabled sum for both possible start states.
+
+    Summaries of consecutive chunks are combined with +, which is associative, so chunks can be summarized in parallel.
+    """
+
+    total: int = 0  # sum of all multiplications
+    enabled_start: int = 0  # sum of enabled multiplications, if the chunk starts out enabled
+    disabled_start: int = 0  # sum of enabled multiplications, if the chunk starts out disabled
+    toggled: bool = False  # whether the chunk contains any do() or don't() instruction
+    enabled_end: bool = True  # the state after the last do() or don't(), only meaningful if toggled
+
+    def end_state(self, enabled_start: bool) -> bool:
+        return self.enabled_end if self.toggled else enabled_start
+
+    def __add__(self, other: "ChunkSummary") -> "ChunkSummary":
+        def continued(enabled: bool) -> int:
+            return other.enabled_start if self.end_state(enabled) else other.disabled_start
+
+        return ChunkSummary(
+            total=self.total + other.total,
+            enabled_start=self.enabled_start + continued(True),
+            disabled_start=self.disabled_start + continued(False),
+            toggled=self.toggled or other.toggled,
+            enabled_end=other.enabled_end if other.toggled else self.enabled_end,
+        )
+
+
+def summarize(buffer: Buffer, start: int, stop: int) -> ChunkSummary:
+    """
+    Summarize all instructions starting in buffer[start:stop]. The last instruction may reach a bit past stop, so
+    consecutive chunks need to overlap by MAX_INSTRUCTION_LENGTH - 1 bytes.
+    """
+    end = min(stop + MAX_INSTRUCTION_LENGTH - 1, len(memoryview(buffer)))
+    total = enabled_start = disabled_start = 0
+    enabled: bool | None = None  # until we see the first do() or don't() the state depends on the previous chunk
+    for m in INSTRUCTION.finditer(buffer, start, end):
+        if m.start() >= stop:
+            break
+        if m.lastindex in (DO, DONT):
+            enabled = m.lastindex == DO
+            continue
+
+        product = number(buffer, *m.span(1)) * number(buffer, *m.span(2))
+        total += product
+        if enabled is None:
+            enabled_start += product
+        elif enabled:
+            enabled_start += product
+            disabled_start += product
+
+    return ChunkSummary(total, enabled_start, disabled_start, enabled is not None, enabled is not False)
+
+
+def summarize_file(path: Path, start: int, stop: int) -> ChunkSummary:
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as memory:
+        return summarize(memory, start, stop)
+
+
+def scan_parallel(memory: Buffer | Path, processes: int | None = None, chunk_size: int = 1 << 26) -> ChunkSummary:
+    """
+    Scan a large buffer or file on multiple cores. Every chunk is summarized in a separate process and the
+    summaries are combined afterwards. Workers map files themselves, whereas buffers are sent to them in slices.
+    """
+    size = memory.stat().st_size if isinstance(memory, Path) else len(memoryview(memory))
+    starts = range(0, size, chunk_size)
+    stops = [min(start + chunk_size, size) for start in starts]
+
+    with ProcessPoolExecutor(processes) as pool:
+        if isinstance(memory, Path):
+            summaries = pool.map(summarize_file, repeat(memory), starts, stops)
+        else:
+            overlap = MAX_INSTRUCTION_LENGTH - 1
+            slices = (
+                bytes(memoryview(memory)[start : stop + overlap]) for start, stop in zip(starts, stops, strict=True)
+            )
+            summaries = pool.map(
+                summarize, slices, repeat(0), (stop - start for start, stop in zip(starts, stops, strict=True))
+            )
+        return reduce(add, summaries, ChunkSummary())
+
+
+@profiled
+def part1(memory: CorruptedMemory) -> int:
+    return scan(memory).total
+
+
+@profiled
+def part2(memory: CorruptedMemory) -> int:
+    return scan(memory).enabled_total
 
 
 @pytest.fixture
-def puzzle_input() -> Instructions:
+def puzzle_input() -> CorruptedMemory:
     return parse(Puzzle(2024, 3).input_data)
 
 
 @pytest.fixture
-def example_input() -> Instructions:
+def example_input() -> CorruptedMemory:
     return parse(
         """
 xmul(2,4)%&mul[3,7]!@^do_not_mul(5,5)+mul(32,64]then(mul(11,8)mul(8,5))
@@ -53,7 +212,7 @@ xmul(2,4)%&mul[3,7]!@^do_not_mul(5,5)+mul(32,64]then(mul(11,8)mul(8,5))
 
 
 @pytest.fixture
-def example_input2() -> Instructions:
+def example_input2() -> CorruptedMemory:
     return parse(
         """
 xmul(2,4)&mul[3,7]!^don't()_mul(5,5)+mul(32,64](mul(11,8)undo()?mul(8,5))
@@ -61,17 +220,42 @@ xmul(2,4)&mul[3,7]!^don't()_mul(5,5)+mul(32,64](mul(11,8)undo()?mul(8,5))
     )
 
 
-def test_part1(puzzle_input: Instructions) -> None:
+def test_part1(puzzle_input: CorruptedMemory) -> None:
     assert part1(puzzle_input) == 171183089
 
 
-def test_example_part1(example_input: Instructions) -> None:
+def test_example_part1(example_input: CorruptedMemory) -> None:
     assert part1(example_input) == 161
 
 
-def test_part2(puzzle_input: Instructions) -> None:
+def test_part2(puzzle_input: CorruptedMemory) -> None:
     assert part2(puzzle_input) == 63866497
 
 
-def test_example_part2(example_input2: Instructions) -> None:
+def test_example_part2(example_input2: CorruptedMemory) -> None:
     assert part2(example_input2) == 48
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 64])
+def test_chunked_scan(chunk_size: int, tmp_path: Path) -> None:
+    memory = b"xmul(2,4)&mul[3,7]!^don't()_mul(5,5)+mul(32,64](mul(11,8)undo()?mul(8,5))mul(123,4)"
+    path = tmp_path / "memory.txt"
+    path.write_bytes(memory)
+    chunks = (memory[i : i + chunk_size] for i in range(0, len(memory), chunk_size))
+
+    for scanner in (scan(memory), scan(chunks), scan_file(path, chunk_size)):
+        assert (scanner.total, scanner.enabled_total) == (161 + 492, 48 + 492)
+
+
+def test_combined_chunk_summaries(tmp_path: Path) -> None:
+    memory = b"xmul(2,4)&mul[3,7]!^don't()_mul(5,5)+mul(32,64](mul(11,8)undo()?mul(8,5))mul(123,4)" * 20
+    expected = ChunkSummary(total=20 * 653, enabled_start=20 * 540, disabled_start=20 * 540 - 8, toggled=True)
+
+    for chunk_size in (1, 13, 100, len(memory)):
+        chunks = [summarize(memory, start, start + chunk_size) for start in range(0, len(memory), chunk_size)]
+        assert reduce(add, chunks) == expected
+
+    path = tmp_path / "memory.txt"
+    path.write_bytes(memory)
+    assert scan_parallel(path, processes=2, chunk_size=100) == expected
+    assert scan_parallel(memory, processes=2, chunk_size=100) == expected
@@ -1,3 +1,5 @@
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
 from itertools import product
 from typing import TypeAlias
 
@@ -5,56 +7,159 @@ import numpy as np
 import pytest
 from aocd.models import Puzzle
 
-PuzzleInput: TypeAlias = np.ndarray
+from aoc.grid import load_grid
+from aoc.profiling import profiled
+
+MEMORY_BUDGET = 1 << 20
 
+PuzzleInput: TypeAlias = np.ndarray
 
+# all eight directions a word can be written in, as (dy, dx)
+DIRECTIONS = [(dy, dx) for dy, dx in product((-1, 0, 1), repeat=2) if (dy, dx) != (0, 0)]
+# words of up to this many letters are packed into a single integer key, so all of them are matched at once
+MAX_PACKED_LENGTH = 8
+# for more target words than this, we look up packed keys by binary search instead of comparing with each word
+MAX_DIRECT_COMPARISONS = 16
+# cells of a template matching any letter
+WILDCARD = ord(".")
+# two MAS in the shape of an X, the other ways of writing it are rotations of this one
+X_MAS = """
+M.S
+.A.
+M.S
+"""
+# the grid is processed in bands of this many rows, to bound the memory of the intermediate arrays
+BAND_ROWS = 1024
+
+
+@profiled
 def parse(data: str) -> PuzzleInput:
-    return np.array([list(l) for l in data.strip().splitlines()])
+    return load_grid(data)
+
+
+def letter_views(grid: np.ndarray, direction: tuple[int, int], length: int) -> Iterator[list[np.ndarray]]:
+    """
+    Yield the letters of all words of the given length and direction in the grid, as one shifted view of the grid per
+    letter. The views are yielded in bands of rows, where views[k][y, x] is the k-th letter of the word starting at
+    the y-th row of the band and the x-th column of the grid (offset by the first valid start position).
+    """
+    height, width = grid.shape
+    dy, dx = direction
+    reach_y, reach_x = (length - 1) * dy, (length - 1) * dx
+    # the range of start positions for which the word fully fits into the grid
+    y0, y1 = max(0, -reach_y), height - max(0, reach_y)
+    x0, x1 = max(0, -reach_x), width - max(0, reach_x)
+    if y0 >= y1 or x0 >= x1:
+        return
+
+    for band in range(y0, y1, BAND_ROWS):
+        band_end = min(band + BAND_ROWS, y1)
+        yield [grid[band + k * dy : band_end + k * dy, x0 + k * dx : x1 + k * dx] for k in range(length)]
+
+
+def count_words(word_search: PuzzleInput, words: Iterable[str]) -> dict[str, int]:
+    """
+    Count how often each of the given words appears in the word search, in any of the eight directions.
+
+    Words of the same length are packed into a single integer per start position, letter by letter, so that each
+    direction needs just one pass per word length, no matter how many words we are looking for.
+    """
+    grid = word_search
+    counts = dict.fromkeys(words, 0)
+    by_length = defaultdict(list)
+    for word in counts:
+        by_length[len(word)].append(word)
+
+    for length, targets in by_length.items():
+        encoded = [np.frombuffer(word.encode(), dtype=np.uint8) for word in targets]
+        keys = pack(list(np.stack(encoded, axis=1))) if len(targets) > 1 and length <= MAX_PACKED_LENGTH else None
+
+        for direction in DIRECTIONS:
+            for views in letter_views(grid, direction, length):
+                if keys is not None:
+                    found = count_keys(pack(views), keys)
+                    for word, n in zip(targets, found, strict=True):
+                        counts[word] += int(n)
+                else:  # a single word (or one too long to pack), we compare it letter by letter
+                    for word, letters in zip(targets, encoded, strict=True):
+                        match = views[0] == letters[0]
+                        for view, letter in zip(views[1:], letters[1:], strict=True):
+                            match &= view == letter
+                        counts[word] += int(np.count_nonzero(match))
+
+    return counts
+
+
+def pack(letters: list[np.ndarray]) -> np.ndarray:
+    """Pack words of up to eight letters into one integer each, given as one array per letter position"""
+    dtype = np.uint16 if len(letters) <= 2 else np.uint32 if len(letters) <= 4 else np.uint64
+    key = letters[0].astype(dtype)
+    for k, letter in enumerate(letters[1:], start=1):
+        key |= letter.astype(dtype) << dtype(8 * k)
+    return key
+
+
+def count_keys(keys: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """Count how often each of the target keys appears in keys"""
+    if len(targets) <= MAX_DIRECT_COMPARISONS:
+        return np.array([np.count_nonzero(keys == target) for target in targets])
+    order = np.argsort(targets)
+    indices = np.searchsorted(targets, keys, sorter=order).clip(max=len(targets) - 1)
+    found = order[indices[targets[order[indices]] == keys]]
+    return np.bincount(found, minlength=len(targets))
+
+
+@profiled
+def part1(word_search: PuzzleInput) -> int:
+    return count_words(word_search, ["XMAS"])["XMAS"]
 
 
-def is_match(word: str, target: str) -> bool:
-    """Check if the given word matches the target string in forward or reverse order"""
-    return word == target or word[::-1] == target
+def template_variants(template: np.ndarray, rotations: bool = False, reflections: bool = False) -> list[np.ndarray]:
+    """Return all distinct variants of the given template, optionally including its rotations and reflections"""
+    variants = [template]
+    if reflections:
+        variants.append(np.fliplr(template))
+    if rotations:
+        variants = [np.rot90(variant, k) for variant in variants for k in range(4)]
 
+    distinct = {(variant.shape, variant.tobytes()): variant for variant in variants}
+    return list(distinct.values())
 
-def part1(word_search: PuzzleInput) -> int:
-    target = "XMAS"
-    height, width = word_search.shape
-    count = 0
-    for y, x in product(range(height), range(width)):
-        if x <= (width - len(target)):  # we have enough space to the right to check horizontally
-            horizontal = "".join(word_search[y, x : x + len(target)])
-            if is_match(horizontal, target):
-                count += 1
-        if y <= (height - len(target)):  # we have enough space to the bottom to check vertically
-            vertical = "".join(word_search[y : y + len(target), x])
-            if is_match(vertical, target):
-                count += 1
-
-            if x <= (width - len(target)):  # check the diagonal from the top left to the bottom right
-                diagonal = "".join(word_search[y + i, x + i] for i in range(len(target)))
-                if is_match(diagonal, target):
-                    count += 1
-            if x >= len(target) - 1:  # check the diagonal from the top right to the bottom left
-                diagonal = "".join(word_search[y + i, x - i] for i in range(len(target)))
-                if is_match(diagonal, target):
-                    count += 1
-
-    return count
 
+def match_template(
+    word_search: PuzzleInput, template: str, rotations: bool = False, reflections: bool = False
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Find all occurrences of a small 2D template in the word search. Template cells containing a "." match any letter.
+
+    Every template cell is compared with a correspondingly shifted view of the whole grid at once, and the resulting
+    boolean masks are combined into a single mask of positions where all cells match.
 
+    Returns:
+        The row and column indices of the top left corners of all matches, of all template variants
+    """
+    grid = word_search
+    height, width = grid.shape
+    pattern = load_grid(template)
+    matches_y, matches_x = [], []
+
+    for variant in template_variants(pattern, rotations, reflections):
+        h, w = variant.shape
+        match = np.ones((max(height - h + 1, 0), max(width - w + 1, 0)), dtype=bool)
+        for (dy, dx), letter in np.ndenumerate(variant):
+            if letter != WILDCARD:
+                match &= grid[dy : dy + match.shape[0], dx : dx + match.shape[1]] == letter
+        y, x = np.nonzero(match)
+        matches_y.append(y)
+        matches_x.append(x)
+
+    return np.concatenate(matches_y), np.concatenate(matches_x)
+
+
+@profiled
 def part2(word_search: PuzzleInput) -> int:
-    target = "MAS"
-    height, width = word_search.shape
-    count = 0
-    for y, x in product(range(height), range(width)):
-        if x <= (width - len(target)) and y <= (height - len(target)):
-            box = word_search[y : y + len(target), x : x + len(target)]  # the square box potentially containing the X
-            diagonal_left_right = "".join(box.diagonal())
-            diagonal_right_left = "".join(np.fliplr(box).diagonal())
-            if is_match(diagonal_left_right, target) and is_match(diagonal_right_left, target):
-                count += 1
-    return count
+    ys, _ = match_template(word_search, X_MAS, rotations=True)
+    return len(ys)
 
 
 @pytest.fixture
@@ -94,3 +199,32 @@ def test_part2(puzzle_input: PuzzleInput) -> None:
 
 def test_example_part2(example_input: PuzzleInput) -> None:
     assert part2(example_input) == 9
+
+
+def test_count_multiple_words(example_input: PuzzleInput) -> None:
+    height, width = example_input.shape
+
+    def brute_force(word: str) -> int:
+        count = 0
+        for (y, x), (dy, dx) in product(product(range(height), range(width)), DIRECTIONS):
+            positions = [(y + k * dy, x + k * dx) for k in range(len(word))]
+            if all(0 <= py < height and 0 <= px < width for py, px in positions):
+                count += bytes(example_input[p] for p in positions) == word.encode()
+        return count
+
+    # words of different lengths, including a palindrome and one that's too long to be packed
+    words = ["XMAS", "MAS", "SAM", "MAM", "MMMSXXMASM", "XMASAMX", "A"]
+    words += ["".join(letters) for letters in product("XMAS", repeat=3)]  # and many words of the same length
+    assert count_words(example_input, words) == {word: brute_force(word) for word in words}
+
+
+def test_match_template(example_input: PuzzleInput) -> None:
+    # a horizontal XMAS, rotated and reflected, matches all horizontal and vertical occurrences
+    lines = [line.tobytes().decode() for grid in (example_input, example_input.T) for line in grid]
+    straight = sum(line.count("XMAS") + line[::-1].count("XMAS") for line in lines)
+    assert len(match_template(example_input, "XMAS", rotations=True, reflections=True)[0]) == straight
+    # every X-MAS has its A in the center, and its corners are all M or S
+    ys, xs = match_template(example_input, X_MAS, rotations=True)
+    assert np.all(example_input[ys + 1, xs + 1] == ord("A"))
+    corners = example_input[np.add.outer(ys, [0, 0, 2, 2]), np.add.outer(xs, [0, 2, 0, 2])]
+    assert np.all(np.sort(corners, axis=1) == np.frombuffer(b"MMSS", dtype=np.uint8))
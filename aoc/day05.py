@@ -1,15 +1,51 @@
 from collections import defaultdict
 from functools import cmp_to_key
+from itertools import chain
 from typing import TypeAlias
 
+import numpy as np
 import pytest
 from aocd.models import Puzzle
 
+from aoc.profiling import profiled
+
+# number of updates for which middle pages are computed at once
+BATCH_SIZE = 1 << 14
+
+MEMORY_BUDGET = 1 << 20
+
+Updates: TypeAlias = list[list[int]]
+
 
 class PageOrdering:
     def __init__(self, rules: dict[int, set[int]]) -> None:
         """Creates a page ordering helper, based from a set of rules in the form { after: {before_a, before_b, ...} }"""
         self.rules = rules
+        # whether there is a rule for every pair of pages in an update, as in the puzzle input. This can't be relied
+        # on anymore once rules are removed.
+        self.complete = True
+
+        # a dense matrix of the same rules, where precedes[a, b] is True if page a needs to come before page b
+        self.precedes = np.zeros((0, 0), dtype=bool)
+        for after, before in rules.items():
+            self.ensure_size(max(before | {after}))
+            self.precedes[list(before), after] = True
+
+    def ensure_size(self, page: int) -> None:
+        """Grow the precedence matrix, so that it includes the given page"""
+        if page >= len(self.precedes):
+            self.precedes = np.pad(self.precedes, (0, page + 1 - len(self.precedes)))
+
+    def add_rule(self, before: int, after: int) -> None:
+        self.rules.setdefault(after, set()).add(before)
+        self.ensure_size(max(before, after))
+        self.precedes[before, after] = True
+
+    def remove_rule(self, before: int, after: int) -> None:
+        self.complete = False
+        self.rules.get(after, set()).discard(before)
+        if max(before, after) < len(self.precedes):
+            self.precedes[before, after] = False
 
     def compare(self, page_a: int, page_b: int) -> int:
         """Compare two pages, return -1 if page_a < page_b, 1 if page_a > page_b, 0 if equal"""
@@ -19,11 +55,109 @@ class PageOrdering:
         before_b = self.rules.get(page_b, set())
         return -1 if page_a in before_b else 1
 
+    def in_order(self, pages: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """
+        Check a whole batch of padded updates (as returned by pad_updates) at once, returning which ones are in the
+        right order. As long as there is a rule for every pair of pages in an update, it's enough to check that no two
+        consecutive pages violate a rule, otherwise all pairs of pages are checked.
+        """
+        self.ensure_size(pages.max(initial=0))  # in case there are pages without any rules
+        if self.complete:
+            violated = self.precedes[pages[:, 1:], pages[:, :-1]]
+            is_pair = np.arange(1, pages.shape[1]) < lengths[:, None]  # ignore pairs including padding
+            return ~np.any(violated & is_pair, axis=1)
+
+        in_order = np.empty(len(pages), dtype=bool)
+        is_page = np.arange(pages.shape[1]) < lengths[:, None]
+        later = np.triu(np.ones((pages.shape[1], pages.shape[1]), dtype=bool), k=1)  # later[i, j] is True if j > i
+        for batch in range(0, len(pages), BATCH_SIZE):
+            rows = slice(batch, batch + BATCH_SIZE)
+            # violated[u, i, j] is True if page j of update u needs to come before the earlier page i
+            violated = self.precedes[pages[rows, None, :], pages[rows, :, None]] & later & is_page[rows, None, :]
+            in_order[rows] = ~violated.any(axis=(1, 2))
+        return in_order
+
+    def middle_pages(self, pages: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """
+        Find the middle page of a batch of padded updates, as if they were sorted into the right order. Instead of
+        sorting, we use that the middle page of an update of length n is the one preceded by n // 2 of its pages.
+        Raises a ValueError if the rules don't determine a unique middle page for every update.
+        """
+        self.ensure_size(pages.max(initial=0))
+        middle_pages = np.empty(len(pages), dtype=pages.dtype)
+        is_page = np.arange(pages.shape[1]) < lengths[:, None]
+        for batch in range(0, len(pages), BATCH_SIZE):  # to bound the size of the (updates, pages, pages) array
+            rows = slice(batch, batch + BATCH_SIZE)
+            predecessors = self.precedes[pages[rows, :, None], pages[rows, None, :]] & is_page[rows, :, None]
+            is_middle = (predecessors.sum(axis=1) == lengths[rows, None] // 2) & is_page[rows]
+            if (undetermined := np.flatnonzero(is_middle.sum(axis=1) != 1)).size > 0:
+                update = pages[batch + undetermined[0], : lengths[batch + undetermined[0]]].tolist()
+                raise ValueError(f"The rules don't determine a unique middle page for the update {update}")
+            middle_pages[rows] = pages[rows][np.arange(len(is_middle)), is_middle.argmax(axis=1)]
+        return middle_pages
+
+
+class UpdateValidator:
+    """
+    Keeps track of which updates are in the right order, and of their middle pages, while rules are added or removed.
+    A rule change only affects updates containing both of its pages, so only those are checked again.
+    """
+
+    def __init__(self, updates: Updates, ordering_rules: PageOrdering) -> None:
+        self.ordering_rules = ordering_rules
+        self.pages, self.lengths = pad_updates(updates)
+        self.in_order = ordering_rules.in_order(self.pages, self.lengths)
+        self.middle_pages = ordering_rules.middle_pages(self.pages, self.lengths)
+
+        # an index of which updates contain a page, as sorted arrays of update indices
+        rows, columns = np.nonzero(np.arange(self.pages.shape[1]) < self.lengths[:, None])
+        order = np.argsort(self.pages[rows, columns], kind="stable")
+        page_numbers, starts = np.unique(self.pages[rows, columns][order], return_index=True)
+        self.updates_containing = dict(zip(page_numbers.tolist(), np.split(rows[order], starts[1:]), strict=True))
+
+    def add_rule(self, before: int, after: int) -> None:
+        """Add a rule, unless that leaves an update without a unique middle page, which raises a ValueError"""
+        existed = self.has_rule(before, after)
+        self.ordering_rules.add_rule(before, after)
+        try:
+            self.refresh(before, after)
+        except ValueError:
+            if not existed:
+                self.ordering_rules.remove_rule(before, after)
+            raise
+
+    def remove_rule(self, before: int, after: int) -> None:
+        """Remove a rule, unless that leaves an update without a unique middle page, which raises a ValueError"""
+        existed = self.has_rule(before, after)
+        self.ordering_rules.remove_rule(before, after)
+        try:
+            self.refresh(before, after)
+        except ValueError:
+            if existed:
+                self.ordering_rules.add_rule(before, after)
+            raise
+
+    def has_rule(self, before: int, after: int) -> bool:
+        return before in self.ordering_rules.rules.get(after, set())
+
+    def refresh(self, page_a: int, page_b: int) -> None:
+        """Check all updates containing both of the given pages again"""
+        empty = np.zeros(0, dtype=np.intp)
+        rows = np.intersect1d(self.updates_containing.get(page_a, empty), self.updates_containing.get(page_b, empty))
+        pages, lengths = self.pages[rows], self.lengths[rows]
+        middle_pages = self.ordering_rules.middle_pages(pages, lengths)  # first, since it may raise
+        self.in_order[rows] = self.ordering_rules.in_order(pages, lengths)
+        self.middle_pages[rows] = middle_pages
+
+    def middle_page_sum(self, in_order: bool) -> int:
+        """Sum of the middle pages of all updates which are (or are not) in the right order"""
+        return int(self.middle_pages[self.in_order == in_order].sum())
+
 
-Updates: TypeAlias = list[list[int]]
 PuzzleInput: TypeAlias = tuple[Updates, PageOrdering]
 
 
+@profiled
 def parse(data: str) -> PuzzleInput:
     orderings, updates = data.strip().split("\n\n")
 
@@ -37,25 +171,26 @@ def parse(data: str) -> PuzzleInput:
     return updates, page_order
 
 
-def part1(updates: Updates, ordering_rules: PageOrdering) -> int:
-    middle_page_sum = 0
+def pad_updates(updates: Updates) -> tuple[np.ndarray, np.ndarray]:
+    """Pad all updates to the same length, returning them as a single 2D array together with their lengths"""
+    lengths = np.array([len(update) for update in updates], dtype=np.intp)
+    pages = np.zeros((len(updates), lengths.max(initial=0)), dtype=np.intp)
+    pages[np.arange(pages.shape[1]) < lengths[:, None]] = np.fromiter(chain.from_iterable(updates), dtype=np.intp)
+    return pages, lengths
 
-    for update in updates:
-        if update == sorted(update, key=cmp_to_key(ordering_rules.compare)):
-            middle_page_sum += update[len(update) // 2]
 
-    return middle_page_sum
+@profiled
+def part1(updates: Updates, ordering_rules: PageOrdering) -> int:
+    pages, lengths = pad_updates(updates)
+    middle_pages = pages[np.arange(len(pages)), lengths // 2]
+    return int(middle_pages[ordering_rules.in_order(pages, lengths)].sum())
 
 
+@profiled
 def part2(updates: Updates, ordering_rules: PageOrdering) -> int:
-    middle_page_sum = 0
-
-    for update in updates:
-        right_order = sorted(update, key=cmp_to_key(ordering_rules.compare))
-        if update != right_order:
-            middle_page_sum += right_order[len(right_order) // 2]
-
-    return middle_page_sum
+    pages, lengths = pad_updates(updates)
+    out_of_order = ~ordering_rules.in_order(pages, lengths)
+    return int(ordering_rules.middle_pages(pages[out_of_order], lengths[out_of_order]).sum())
 
 
 @pytest.fixture
@@ -113,3 +248,53 @@ def test_part2(puzzle_input: PuzzleInput) -> None:
 
 def test_example_part2(example_input: PuzzleInput) -> None:
     assert part2(*example_input) == 123
+
+
+def test_in_order_matches_sorting(example_input: PuzzleInput) -> None:
+    updates, ordering_rules = example_input
+    in_order = [update == sorted(update, key=cmp_to_key(ordering_rules.compare)) for update in updates]
+    assert ordering_rules.in_order(*pad_updates(updates)).tolist() == in_order
+
+
+def test_incremental_rule_changes(example_input: PuzzleInput) -> None:
+    updates, ordering_rules = example_input
+    validator = UpdateValidator(updates, ordering_rules)
+    assert (validator.middle_page_sum(True), validator.middle_page_sum(False)) == (143, 123)
+
+    # 75,97,47,61,53 is in the wrong order only because of 97|75
+    validator.remove_rule(97, 75)
+    validator.add_rule(75, 97)
+    fresh = UpdateValidator(updates, PageOrdering(ordering_rules.rules))
+    assert validator.in_order.tolist() == fresh.in_order.tolist() == [True, True, True, True, False, False]
+    assert validator.middle_pages.tolist() == fresh.middle_pages.tolist()
+
+
+def test_incomplete_rules() -> None:
+    ordering_rules = PageOrdering({20: {10}, 30: {10, 20}})
+    ordering_rules.remove_rule(10, 20)
+    ordering_rules.remove_rule(20, 30)
+    # 10|30 still forbids the first update, even though none of its consecutive pages have a rule anymore
+    assert ordering_rules.in_order(*pad_updates([[30, 20, 10], [20, 10, 30]])).tolist() == [False, True]
+    assert ordering_rules.middle_pages(*pad_updates([[30, 20, 10]])).tolist() == [30]  # preceded by one other page
+    with pytest.raises(ValueError, match="unique middle page"):
+        ordering_rules.middle_pages(*pad_updates([[20, 10]]))  # neither page is preceded by the other one
+
+    ordering_rules = PageOrdering({20: {10}, 30: {10, 20}})
+    validator = UpdateValidator([[30, 20, 10]], ordering_rules)
+    with pytest.raises(ValueError, match="unique middle page"):
+        validator.remove_rule(10, 20)
+    assert ordering_rules.precedes[10, 20]  # the removal was rejected
+    assert validator.middle_pages.tolist() == [20]
+
+
+def test_rejected_rule() -> None:
+    ordering_rules = PageOrdering({20: {10}, 30: {10, 20}})
+    validator = UpdateValidator([[10, 20, 30]], ordering_rules)
+    # 30|10 contradicts 10|30, which leaves all pages preceded by exactly one other page
+    with pytest.raises(ValueError, match="unique middle page"):
+        validator.add_rule(30, 10)
+    assert not ordering_rules.precedes[30, 10]  # the rule was rolled back
+    assert ordering_rules.rules.get(10, set()) == set()
+    assert ordering_rules.precedes[10, 30]  # without touching the existing one
+    assert validator.in_order.tolist() == [True]
+    assert validator.middle_pages.tolist() == [20]
@@ -1,21 +1,54 @@
-from collections.abc import Iterator
-from typing import TypeAlias
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import batched, pairwise
+from typing import Any, Literal, TypeAlias, TypeVar
 
 import numpy as np
 import pytest
 from aocd.models import Puzzle
 
+from aoc.grid import load_grid
+from aoc.profiling import profiled
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+try:
+    from numba import njit
+except ImportError:  # the array backend works without numba as well, its kernels just run as plain python
+
+    def njit(*_args: Any, **_kwargs: Any) -> Callable[[F], F]:
+        return lambda kernel: kernel
+
+
 PuzzleInput: TypeAlias = tuple[complex, complex, set[complex], set[complex]]
 
+# a candidate obstruction, together with the guard state (position, facing) right before it first reaches it
+Candidate: TypeAlias = tuple[complex, complex, complex]
+
+# number of candidate obstructions sent to a worker process at once
+CANDIDATE_BATCH_SIZE = 256
+
+MEMORY_BUDGET = 3 << 20
+
+# "sets" simulates the guard with complex coordinates in sets, "array" with compiled kernels over a flat grid
+Backend: TypeAlias = Literal["sets", "array"]
+
 # using complex numbers to represent 2D-coordinates and directions
 UP = -1 + 0j
 RIGHT_TURN = -1j
+# all four directions, in the order the guard turns
+DIRECTIONS = [UP * RIGHT_TURN**i for i in range(4)]
+
+# cell values of the grid used by the array backend
+FREE, OBSTRUCTION, BORDER = 0, 1, 2
 
 
+@profiled
 def parse(data: str) -> PuzzleInput:
-    grid = np.array([list(l) for l in data.strip().splitlines()])
     # pad our grid with a wall on all sides, so we can easily find out when we leave the grid
-    grid = np.pad(grid, 1, constant_values="+")
+    grid = np.pad(load_grid(data), 1, constant_values=ord("+"))
 
     border = coords_of(grid, "+")  # a set of coords denoting the bounds of the grid
     obstructions = coords_of(grid, "#")  # a set of coords of all obstacles
@@ -26,7 +59,7 @@ def parse(data: str) -> PuzzleInput:
 
 def coords_of(grid: np.ndarray, ch: str) -> set[complex]:
     """Return a set of coordinates of all grid cells containing the given character"""
-    return {(int(y) + 1j * int(x)) for y, x in zip(*np.where(grid == ch), strict=True)}
+    return {(int(y) + 1j * int(x)) for y, x in zip(*np.where(grid == ord(ch)), strict=True)}
 
 
 def simulate_guard_movement(
@@ -54,36 +87,239 @@ def find_visited_positions(
     return visited
 
 
-def part1(start_pos: complex, start_direction: complex, obstructions: set[complex], border: set[complex]) -> int:
+@profiled
+def part1(
+    start_pos: complex,
+    start_direction: complex,
+    obstructions: set[complex],
+    border: set[complex],
+    backend: Backend = "sets",
+) -> int:
+    if backend == "array":
+        grid, offsets, pos, direction = to_flat_grid(start_pos, start_direction, obstructions, border)
+        seen, _ = walk(grid, offsets, pos, direction)
+        return int(np.count_nonzero(seen))
+
     return len(find_visited_positions(start_pos, start_direction, obstructions, border))
 
 
-def part2(start_pos: complex, start_direction: complex, obstructions: set[complex], border: set[complex]) -> int:
-    # to avoid checking every position in the grid, we only check positions that are actually reachable on the path
-    positions_to_check = find_visited_positions(start_pos, start_direction, obstructions, border) - {start_pos}
-    possible_obstructions = set()
+class ObstacleIndex:
+    """
+    Sorted coordinates of all obstructions in every row and every column, which allows the guard to jump straight to
+    the next obstruction in front of it instead of walking there step by step.
+    """
+
+    def __init__(self, obstructions: set[complex]) -> None:
+        self.rows: dict[int, list[int]] = {}  # row -> sorted columns of the obstructions in that row
+        self.columns: dict[int, list[int]] = {}  # column -> sorted rows of the obstructions in that column
+        for pos in sorted(obstructions, key=lambda pos: (pos.real, pos.imag)):
+            self.rows.setdefault(int(pos.real), []).append(int(pos.imag))
+        for pos in sorted(obstructions, key=lambda pos: (pos.imag, pos.real)):
+            self.columns.setdefault(int(pos.imag), []).append(int(pos.real))
+
+    def next_stop(self, pos: complex, facing: complex) -> complex | None:
+        """Return the position right in front of the next obstruction ahead, or None if the guard leaves the grid"""
+        y, x = int(pos.real), int(pos.imag)
+        vertical = facing.imag == 0
+        line, coord = (self.columns.get(x, []), y) if vertical else (self.rows.get(y, []), x)
+
+        if facing.real + facing.imag > 0:  # moving down or right, towards larger coordinates
+            i = bisect_right(line, coord)
+            if i == len(line):
+                return None
+            stop = line[i] - 1
+        else:  # moving up or left
+            i = bisect_left(line, coord)
+            if i == 0:
+                return None
+            stop = line[i - 1] + 1
+
+        return complex(stop, x) if vertical else complex(y, stop)
+
+    @contextmanager
+    def obstructed(self, pos: complex) -> Iterator[None]:
+        """Temporarily add another obstruction, which only touches the lookups of its row and column"""
+        y, x = int(pos.real), int(pos.imag)
+        insort(self.rows.setdefault(y, []), x)
+        insort(self.columns.setdefault(x, []), y)
+        try:
+            yield
+        finally:
+            self.rows[y].remove(x)
+            self.columns[x].remove(y)
+
+
+def find_candidates(
+    start_pos: complex, start_direction: complex, obstructions: set[complex], border: set[complex]
+) -> list[Candidate]:
+    """
+    Find all positions on the guard's path where an additional obstruction could be placed. Up until the guard first
+    reaches such a position its path is unaffected by the obstruction, so we remember the state right before that, to
+    resume the simulation from there instead of from the start.
+    """
+    candidates = {}
+    for (pos, facing), (next_pos, _) in pairwise(
+        simulate_guard_movement(start_pos, start_direction, obstructions, border)
+    ):
+        if next_pos not in (pos, start_pos) and next_pos not in candidates:
+            candidates[next_pos] = (next_pos, pos, facing)
+    return list(candidates.values())
+
+
+def count_loops(candidates: Iterable[Candidate], index: ObstacleIndex) -> int:
+    """Count the candidate obstructions which would result in a loop"""
+    loops = 0
+    for obstruction, pos, facing in candidates:
+        with index.obstructed(obstruction):
+            loops += contains_loop(pos, facing, index)
+    return loops
+
+
+# the obstacle index of a worker process, built once when the worker starts
+worker_index: ObstacleIndex | None = None
+
+
+def init_worker(obstructions: set[complex]) -> None:
+    global worker_index  # noqa: PLW0603
+    worker_index = ObstacleIndex(obstructions)
+
+
+def count_loops_in_worker(candidates: Iterable[Candidate]) -> int:
+    if worker_index is None:
+        raise RuntimeError("Worker process has not been initialized")
+    return count_loops(candidates, worker_index)
+
+
+@profiled
+def part2(  # noqa: PLR0913
+    start_pos: complex,
+    start_direction: complex,
+    obstructions: set[complex],
+    border: set[complex],
+    processes: int = 1,
+    backend: Backend = "sets",
+) -> int:
+    if backend == "array":
+        if processes != 1:  # the compiled kernel checks all candidates in a single process
+            raise ValueError(f"The array backend runs in a single process, got processes={processes}")
+        grid, offsets, pos, direction = to_flat_grid(start_pos, start_direction, obstructions, border)
+        _, entries = walk(grid, offsets, pos, direction)
+        entries[pos] = -1  # we can't place an obstruction at the start position
+        (candidates,) = np.nonzero(entries >= 0)
+        return count_loops_kernel(grid, offsets, candidates, entries[candidates])
+
+    candidates = find_candidates(start_pos, start_direction, obstructions, border)
+    if processes == 1:
+        return count_loops(candidates, ObstacleIndex(obstructions))
+
+    # every worker builds its own obstacle index once, instead of receiving it with every batch of candidates
+    with ProcessPoolExecutor(processes, initializer=init_worker, initargs=(obstructions,)) as pool:
+        return sum(pool.map(count_loops_in_worker, batched(candidates, CANDIDATE_BATCH_SIZE)))
+
+
+def contains_loop(start_pos: complex, start_direction: complex, index: ObstacleIndex) -> bool:
+    """
+    Checks if the guard movement with the given obstructions would result in a loop. The guard jumps from obstruction
+    to obstruction, so we only need to remember the states in which it turned.
+    """
+    seen_turns = set()
+    pos, facing = start_pos, start_direction
+
+    while (stop := index.next_stop(pos, facing)) is not None:
+        if (stop, facing) in seen_turns:  # we have turned here before -> loop
+            return True
+        seen_turns.add((stop, facing))
+        pos, facing = stop, facing * RIGHT_TURN
+
+    return False
 
-    for pos in positions_to_check:
-        if contains_loop(start_pos, start_direction, obstructions | {pos}, border):
-            possible_obstructions.add(pos)
 
-    return len(possible_obstructions)
+def obstruction_grid(obstructions: set[complex], border: set[complex]) -> np.ndarray:
+    """Convert the obstructions and the border back into a grid of FREE, OBSTRUCTION and BORDER cells"""
+    shape = (int(max(pos.real for pos in border)) + 1, int(max(pos.imag for pos in border)) + 1)
+    grid = np.full(shape, FREE, dtype=np.uint8)
+    for cells, value in ((obstructions, OBSTRUCTION), (border, BORDER)):
+        grid[[int(pos.real) for pos in cells], [int(pos.imag) for pos in cells]] = value
+    return grid
 
 
-def contains_loop(
+def to_flat_grid(
     start_pos: complex, start_direction: complex, obstructions: set[complex], border: set[complex]
-) -> bool:
-    """Checks if the guard movement with the given obstructions would result in a loop"""
-    seen_states = set()
-
-    for pos, facing in simulate_guard_movement(start_pos, start_direction, obstructions, border):
-        if (pos, facing) in seen_states:  # we have been here before -> loop
+) -> tuple[np.ndarray, np.ndarray, int, int]:
+    """
+    Convert the puzzle input for the array backend, where positions are indices into a flattened grid and directions
+    are indices into an array of the corresponding index offsets.
+
+    Returns:
+        The flat grid, the index offset of every direction, the start position and the start direction
+    """
+    grid = obstruction_grid(obstructions, border)
+    width = grid.shape[1]
+    offsets = np.array([int(d.real) * width + int(d.imag) for d in DIRECTIONS], dtype=np.int64)
+    start = int(start_pos.real) * width + int(start_pos.imag)
+    return grid.ravel(), offsets, start, DIRECTIONS.index(start_direction)
+
+
+def walk(grid: np.ndarray, offsets: np.ndarray, pos: int, direction: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Simulate the guard's movement on the flat grid. A guard state is encoded as a single integer pos * 4 + direction.
+
+    Returns:
+        A bitmask per cell of the directions the guard was facing there, and for every cell the guard entered the
+        state right before it first entered it (-1 for all other cells)
+    """
+    seen = np.zeros(len(grid), dtype=np.uint8)
+    entries = np.full(len(grid), -1, dtype=np.int64)
+    walk_kernel(grid, offsets, pos * 4 + direction, seen, entries)
+    return seen, entries
+
+
+@njit(cache=True)
+def walk_kernel(grid: np.ndarray, offsets: np.ndarray, state: int, seen: np.ndarray, entries: np.ndarray) -> bool:
+    """Simulate the guard's movement, filling in the arrays described in walk. Returns whether the guard loops."""
+    pos, direction = state // 4, state % 4
+    while grid[pos] != BORDER:
+        if seen[pos] & (1 << direction):  # we have been here, facing the same way -> loop
             return True
-        seen_states.add((pos, facing))
-
+        seen[pos] |= 1 << direction
+
+        ahead = pos + offsets[direction]
+        if grid[ahead] == OBSTRUCTION:
+            direction = (direction + 1) % 4
+        else:
+            if entries[ahead] < 0 and grid[ahead] == FREE:  # record the first entry into cells inside the grid
+                entries[ahead] = pos * 4 + direction
+            pos = ahead
     return False
 
 
+@njit(cache=True)
+def count_loops_kernel(grid: np.ndarray, offsets: np.ndarray, candidates: np.ndarray, states: np.ndarray) -> int:
+    """
+    Count the candidate obstructions which would result in a loop, simulating the guard from the given state for
+    every candidate. Seen states are stamped with the index of the candidate, so they never need to be cleared.
+    """
+    stamps = np.zeros(len(grid) * 4, dtype=np.int64)
+    loops = 0
+    for i in range(len(candidates)):
+        grid[candidates[i]] = OBSTRUCTION
+        pos, direction = states[i] // 4, states[i] % 4
+        while grid[pos] != BORDER:
+            state = pos * 4 + direction
+            if stamps[state] == i + 1:
+                loops += 1
+                break
+            stamps[state] = i + 1
+
+            ahead = pos + offsets[direction]
+            if grid[ahead] == OBSTRUCTION:
+                direction = (direction + 1) % 4
+            else:
+                pos = ahead
+        grid[candidates[i]] = FREE
+    return loops
+
+
 @pytest.fixture
 def puzzle_input() -> PuzzleInput:
     return parse(Puzzle(2024, 6).input_data)
@@ -121,3 +357,31 @@ def test_part2(puzzle_input: PuzzleInput) -> None:
 
 def test_example_part2(example_input: PuzzleInput) -> None:
     assert part2(*example_input) == 6
+
+
+def test_jumps_match_steps(example_input: PuzzleInput) -> None:
+    start_pos, start_direction, obstructions, _ = example_input
+    turns = [
+        pos
+        for (pos, facing), (_, next_facing) in pairwise(simulate_guard_movement(*example_input))
+        if facing != next_facing
+    ]
+
+    index = ObstacleIndex(obstructions)
+    pos, facing, jumps = start_pos, start_direction, []
+    while (pos := index.next_stop(pos, facing)) is not None:
+        jumps.append(pos)
+        facing *= RIGHT_TURN
+    assert jumps == turns
+
+
+def test_part2_in_parallel(example_input: PuzzleInput) -> None:
+    assert part2(*example_input, processes=2) == 6
+    with pytest.raises(ValueError, match="single process"):
+        part2(*example_input, processes=2, backend="array")
+
+
+@pytest.mark.parametrize("backend", ["sets", "array"])
+def test_backends(example_input: PuzzleInput, backend: Backend) -> None:
+    assert part1(*example_input, backend=backend) == 41
+    assert part2(*example_input, backend=backend) == 6
@@ -1,13 +1,18 @@
 from typing import TypeAlias
 
-import networkx as nx
 import numpy as np
 import pytest
 from aocd.models import Puzzle
 
+from aoc.grid import DIRECTIONS, GridGraph
+from aoc.profiling import profiled
+
+MEMORY_BUDGET = 1 << 20
+
 PuzzleInput: TypeAlias = tuple[np.ndarray, list[tuple[int, int]], list[tuple[int, int]]]
 
 
+@profiled
 def parse(data: str) -> PuzzleInput:
     topo = np.asarray([list(map(int, line)) for line in data.split("\n")])
     trailheads = list(zip(*np.where(topo == 0), strict=True))
@@ -15,34 +20,182 @@ def parse(data: str) -> PuzzleInput:
     return topo, trailheads, end_positions
 
 
-def graph_from_topo(topo: np.ndarray) -> nx.Graph:
-    graph = nx.grid_2d_graph(*topo.shape).to_directed()
-    edges = [(src, dst) for src, dst in graph.edges if (topo[src] + 1) == topo[dst]]
-    return graph.edge_subgraph(edges)
+def graph_from_topo(topo: np.ndarray, climb: int = 1) -> GridGraph:
+    """The graph of all steps along hiking trails, uphill (for a climb of 1) or back downhill (for a climb of -1)"""
+    return GridGraph.from_grid(topo, lambda src, dst: src + climb == dst)
 
 
-def part1(topo: np.ndarray, trailheads: list[tuple[int, int]], end_positions: list[tuple[int, int]]) -> int:
+def trail_ratings(topo: np.ndarray) -> np.ndarray:
+    """
+    Count the distinct hiking trails from every position to any summit. We go through the heights from 9 down to 0,
+    since the number of trails from a position is the sum of the number of trails from all its uphill neighbours.
+    """
     graph = graph_from_topo(topo)
-
-    score = 0
-    for end in end_positions:
-        shortest_path_from_all_positions = nx.single_target_shortest_path(graph, end)
-        for start in shortest_path_from_all_positions:
-            if start in trailheads:
-                score += 1
-
-    return score
+    ratings = (topo == 9).astype(np.int64).ravel()
+    for height in range(8, -1, -1):
+        level = np.flatnonzero(topo == height)
+        ratings[level] = graph.reduce_neighbours(ratings, np.add, level)
+    return ratings.reshape(topo.shape)
+
+
+def reachability(topo: np.ndarray, sources: np.ndarray, climb: int = 1) -> np.ndarray:
+    """
+    Compute which of the given source positions can be reached from every position, following trails uphill (for a
+    climb of 1, where sources are summits) or downhill (for a climb of -1, where sources are trailheads).
+    The result is a bitset of shape (height, width, sources / 64), where bit i stands for the i-th source.
+
+    Just like the ratings, these are propagated level by level, combining the bitsets of all neighbours on a trail.
+    """
+    graph = graph_from_topo(topo, climb)
+    words = (len(sources) + 63) // 64
+    reachable = np.zeros((topo.size, words), dtype=np.uint64)
+    ids = np.arange(len(sources))
+    if len(sources) > 0:
+        cells = np.ravel_multi_index((sources[:, 0], sources[:, 1]), topo.shape)
+        reachable[cells, ids // 64] = np.uint64(1) << (ids % 64).astype(np.uint64)
+
+    for height in range(8, -1, -1) if climb == 1 else range(1, 10):
+        level = np.flatnonzero(topo == height)
+        reachable[level] |= graph.reduce_neighbours(reachable, np.bitwise_or, level)
+    return reachable.reshape(*topo.shape, words)
+
+
+def set_bits(bitset: np.ndarray) -> np.ndarray:
+    """Indices of all set bits in a bitset of uint64 words"""
+    return np.flatnonzero(np.unpackbits(bitset.view(np.uint8), bitorder="little"))
+
+
+class SourceBits:
+    """Assigns every summit (or trailhead) a bit in the reachability bitsets, reusing the bits of removed ones"""
+
+    def __init__(self, positions: np.ndarray) -> None:
+        self.positions: list[tuple[int, int] | None] = [(int(y), int(x)) for y, x in positions]
+        self.bits = {pos: bit for bit, pos in enumerate(self.positions)}
+        self.free: list[int] = []
+
+    def add(self, pos: tuple[int, int]) -> None:
+        if self.free:
+            bit = self.free.pop()
+            self.positions[bit] = pos
+        else:
+            bit = len(self.positions)
+            self.positions.append(pos)
+        self.bits[pos] = bit
+
+    def remove(self, pos: tuple[int, int]) -> None:
+        if (bit := self.bits.pop(pos, None)) is not None:
+            self.positions[bit] = None
+            self.free.append(bit)
+
+    def fit(self, bitsets: np.ndarray) -> np.ndarray:
+        """Grow the bitsets by another word, in case there are more bits than fit into them"""
+        if len(self.positions) > bitsets.shape[2] * 64:
+            return np.pad(bitsets, [(0, 0), (0, 0), (0, 1)])
+        return bitsets
+
+    def bitset(self, pos: tuple[int, int], words: int) -> np.ndarray:
+        """The bitset with just the bit of the given position set, if it has one"""
+        bitset = np.zeros(words, dtype=np.uint64)
+        if (bit := self.bits.get(pos)) is not None:
+            bitset[bit // 64] = np.uint64(1) << np.uint64(bit % 64)
+        return bitset
+
+
+class TrailIndex:
+    """
+    Precomputed trail ratings and reachability between all trailheads and summits of a map, to answer queries about
+    single trailheads and summits without recomputation. Heights can be changed one position at a time, which only
+    recomputes the positions with trails leading through the changed position.
+    """
+
+    def __init__(self, topo: np.ndarray) -> None:
+        self.topo = topo.copy()
+        self.ratings = trail_ratings(self.topo)
+
+        # which summits can be reached from a position, and which trailheads it can be reached from
+        self.summits, self.trailheads = SourceBits(np.argwhere(self.topo == 9)), SourceBits(np.argwhere(self.topo == 0))
+        self.reachable = reachability(self.topo, np.argwhere(self.topo == 9), climb=1)
+        self.reached_from = reachability(self.topo, np.argwhere(self.topo == 0), climb=-1)
+
+    def score(self, trailhead: tuple[int, int]) -> int:
+        return int(np.bitwise_count(self.reachable[trailhead]).sum())
+
+    def rating(self, trailhead: tuple[int, int]) -> int:
+        return int(self.ratings[trailhead])
+
+    def trailheads_reaching(self, summit: tuple[int, int]) -> list[tuple[int, int]]:
+        return [
+            trailhead for bit in set_bits(self.reached_from[summit]) if (trailhead := self.trailheads.positions[bit])
+        ]
+
+    def neighbours(self, pos: tuple[int, int], climb: int) -> list[tuple[int, int]]:
+        """All neighbours of a position which continue a trail uphill (climb 1) or downhill (climb -1)"""
+        height, width = self.topo.shape
+        y, x = pos
+        return [
+            (y + dy, x + dx)
+            for dy, dx in DIRECTIONS
+            if 0 <= y + dy < height and 0 <= x + dx < width and self.topo[y + dy, x + dx] == self.topo[pos] + climb
+        ]
+
+    def cone(self, pos: tuple[int, int], climb: int) -> set[tuple[int, int]]:
+        """All positions reachable from pos by following trails uphill (climb 1) or downhill (climb -1)"""
+        cone, todo = {pos}, [pos]
+        while todo:
+            for neighbour in self.neighbours(todo.pop(), climb):
+                if neighbour not in cone:
+                    cone.add(neighbour)
+                    todo.append(neighbour)
+        return cone
+
+    def set_height(self, pos: tuple[int, int], height: int) -> None:
+        """Change the height of a single position, and repair everything depending on trails through it"""
+        if not 0 <= height <= 9:
+            raise ValueError(f"Invalid height: {height}")
+
+        # the ratings and reachable summits of all positions with trails leading up to pos may change, as well as which
+        # trailheads can reach the positions with trails leading on from pos. We collect them before and after.
+        leading_up, leading_on = self.cone(pos, -1), self.cone(pos, 1)
+        self.topo[pos] = height
+        leading_up |= self.cone(pos, -1)
+        leading_on |= self.cone(pos, 1)
+
+        self.summits.remove(pos)
+        self.trailheads.remove(pos)
+        if height == 9:
+            self.summits.add(pos)
+        if height == 0:
+            self.trailheads.add(pos)
+        self.reachable = self.summits.fit(self.reachable)
+        self.reached_from = self.trailheads.fit(self.reached_from)
+
+        for cell in sorted(leading_up, key=lambda cell: -self.topo[cell]):  # uphill neighbours need to be done first
+            uphill = self.neighbours(cell, 1)
+            self.ratings[cell] = sum(self.ratings[neighbour] for neighbour in uphill) + (self.topo[cell] == 9)
+            self.reachable[cell] = self.summits.bitset(cell, self.reachable.shape[2])
+            for neighbour in uphill:
+                self.reachable[cell] |= self.reachable[neighbour]
+
+        for cell in sorted(leading_on, key=lambda cell: self.topo[cell]):  # downhill neighbours need to be done first
+            self.reached_from[cell] = self.trailheads.bitset(cell, self.reached_from.shape[2])
+            for neighbour in self.neighbours(cell, -1):
+                self.reached_from[cell] |= self.reached_from[neighbour]
+
+
+@profiled
+def part1(topo: np.ndarray, trailheads: list[tuple[int, int]], end_positions: list[tuple[int, int]]) -> int:
+    if not trailheads or not end_positions:
+        return 0
+    reachable = reachability(topo, np.array(end_positions))
+    return int(np.bitwise_count(reachable[tuple(np.transpose(trailheads))]).sum())
 
 
+@profiled
 def part2(topo: np.ndarray, trailheads: list[tuple[int, int]], end_positions: list[tuple[int, int]]) -> int:
-    graph = graph_from_topo(topo)
-
-    score = 0
-    for start in trailheads:
-        for end in end_positions:
-            score += len(list(nx.all_simple_paths(graph, start, end)))
-
-    return score
+    _ = end_positions
+    if not trailheads:
+        return 0
+    return int(trail_ratings(topo)[tuple(np.transpose(trailheads))].sum())
 
 
 @pytest.fixture
@@ -80,3 +233,23 @@ def test_part2(puzzle_input: PuzzleInput) -> None:
 
 def test_example_part2(example_input: PuzzleInput) -> None:
     assert part2(*example_input) == 81
+
+
+def test_trail_index(example_input: PuzzleInput) -> None:
+    topo, trailheads, end_positions = example_input
+    index = TrailIndex(topo)
+    assert sum(index.score(trailhead) for trailhead in trailheads) == 36
+    assert sum(index.rating(trailhead) for trailhead in trailheads) == 81
+    assert sum(len(index.trailheads_reaching(summit)) for summit in end_positions) == 36
+
+    rng = np.random.default_rng(10)
+    for _ in range(50):
+        pos = (int(rng.integers(topo.shape[0])), int(rng.integers(topo.shape[1])))
+        index.set_height(pos, int(rng.integers(10)))
+
+        fresh = TrailIndex(index.topo)
+        for trailhead in np.argwhere(index.topo == 0):
+            assert index.score(tuple(trailhead)) == fresh.score(tuple(trailhead))
+            assert index.rating(tuple(trailhead)) == fresh.rating(tuple(trailhead))
+        for summit in np.argwhere(index.topo == 9):
+            assert sorted(index.trailheads_reaching(tuple(summit))) == sorted(fresh.trailheads_reaching(tuple(summit)))
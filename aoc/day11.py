@@ -1,46 +1,255 @@
-from functools import cache
+from collections import Counter
+from collections.abc import Iterable
+from math import isqrt
 from typing import TypeAlias
 
+import numpy as np
 import pytest
 from aocd.models import Puzzle
+from scipy.sparse import csr_array
+
+from aoc.profiling import profiled
+
+MEMORY_BUDGET = 4 << 20
 
 PuzzleInput: TypeAlias = list[int]
 
+# moduli are limited to 31 bits, so that products of two residues still fit into an int64
+MAX_MODULUS = (1 << 31) - 1
+
+
+def is_prime(n: int) -> bool:
+    return n >= 2 and all(n % d for d in range(2, isqrt(n) + 1))
 
+
+@profiled
 def parse(data: str) -> PuzzleInput:
     return list(map(int, data.strip().split(" ")))
 
 
-@cache
+def split_digits(stone: int) -> tuple[int, int] | None:
+    """
+    Split a stone with an even number of digits into its left and right half, e.g. 1234 -> (12, 34), computing the
+    number of digits arithmetically instead of going through str
+
+    Returns:
+        The two halves, or None if the stone has an odd number of digits
+    """
+    digits, power = 1, 10
+    while stone >= power:
+        digits += 1
+        power *= 10
+    if digits % 2 == 1:
+        return None
+    return divmod(stone, 10 ** (digits // 2))
+
+
+def successors(stone: int) -> tuple[int, ...]:
+    """The stones a single stone turns into when blinking once"""
+    if stone == 0:
+        return (1,)
+    halves = split_digits(stone)
+    if halves is not None:
+        return halves
+    return (stone * 2024,)
+
+
+def blink(stones: Counter[int], memo: dict[int, tuple[int, ...]]) -> Counter[int]:
+    """
+    Blink once, with stones given as a multiset mapping each stone value to how often it occurs. The successors of
+    every stone value are remembered in the given memo, which is bounded by the number of distinct stone values, small
+    since the stones always follow repeatable patterns.
+    """
+    blinked: Counter[int] = Counter()
+    for stone, count in stones.items():
+        if (stone_successors := memo.get(stone)) is None:
+            stone_successors = memo[stone] = successors(stone)
+        for successor in stone_successors:
+            blinked[successor] += count
+    return blinked
+
+
+def blink_times(stones: Iterable[int], blinks: int) -> Counter[int]:
+    """
+    Blink the given number of times, one blink after the other. Since the order of stones does not matter for
+    counting them, we only keep track of how often each stone value occurs, so memory is bounded by the number of
+    distinct stone values rather than the number of blinks or stones
+    """
+    counts = Counter(stones)
+    memo: dict[int, tuple[int, ...]] = {}  # only kept for this run, so it doesn't grow with every input ever seen
+    for _ in range(blinks):
+        counts = blink(counts, memo)
+    return counts
+
+
 def expands_to(stone: int, remaining_blinks: int) -> int:
     """
     Calculate how many stones the given stone will expand to with the given number of remaining blinks
 
-    Designing the function like this allows us to use dynamic programming by caching previously computed results,
-    since the stones always follow repeatable patterns
-
     Returns:
         Number of stones this stone will expand to in the remaining number of blinks
     """
-    if remaining_blinks <= 1:
-        return 2 if len(str(stone)) % 2 == 0 else 1
+    return blink_times([stone], remaining_blinks).total()
+
+
+def closed_values(stones: Iterable[int]) -> list[int]:
+    """All stone values that can ever appear when blinking, starting from the given stones"""
+    seen = set(stones)
+    todo = list(seen)
+    while todo:
+        for successor in successors(todo.pop()):
+            if successor not in seen:
+                seen.add(successor)
+                todo.append(successor)
+    return sorted(seen)
+
+
+def check_modulus(modulus: int) -> None:
+    if not is_prime(modulus) or modulus > MAX_MODULUS:
+        raise ValueError(f"Modulus must be a prime of at most {MAX_MODULUS}, got {modulus}")
+
+
+def mod_dot(a: np.ndarray, b: np.ndarray, modulus: int) -> int:
+    """
+    Dot product of two vectors of residues modulo a prime < 2**31. To stay within int64, a is split into 16-bit halves,
+    which keeps each product below 2**47, so up to 2**16 of them can be summed up without overflow
+    """
+    high, low = a >> 16, a & 0xFFFF
+    return (int(high @ b) % modulus * 0x10000 + int(low @ b)) % modulus
 
-    if stone == 0:
-        return expands_to(1, remaining_blinks - 1)
 
-    as_str = str(stone)
-    if len(as_str) % 2 == 0:
-        left_stone = int(as_str[: len(as_str) // 2])
-        right_stone = int(as_str[len(as_str) // 2 :])
-        return expands_to(left_stone, remaining_blinks - 1) + expands_to(right_stone, remaining_blinks - 1)
+def mod_convolve(a: np.ndarray, b: np.ndarray, modulus: int) -> np.ndarray:
+    """Multiply two polynomials with coefficients modulo a prime < 2**31, splitting a just like mod_dot"""
+    high, low = np.convolve(a >> 16, b) % modulus, np.convolve(a & 0xFFFF, b)
+    return (high * 0x10000 + low) % modulus
 
-    return expands_to(stone * 2024, remaining_blinks - 1)
 
+def berlekamp_massey(sequence: np.ndarray, modulus: int) -> np.ndarray:
+    """
+    Find the shortest linear recurrence s[n] = c[0] * s[n - 1] + ... + c[L - 1] * s[n - L] modulo a prime, which
+    generates the given sequence. For a sequence generated by an N x N matrix, 2N terms are enough to find it.
+
+    Returns:
+        The coefficients c of the recurrence
+    """
+    n = len(sequence)
+    # connection polynomials C (the current one) and B (the one before the last length change), with C[0] = 1
+    connection, before = np.zeros(n + 1, dtype=np.int64), np.zeros(n + 1, dtype=np.int64)
+    connection[0] = before[0] = 1
+    length, shift, last_discrepancy = 0, 1, 1
+    for i in range(n):
+        # how far off the current recurrence is in predicting the next term
+        discrepancy = int(sequence[i]) + mod_dot(connection[1 : length + 1], sequence[i - length : i][::-1], modulus)
+        discrepancy %= modulus
+        if discrepancy == 0:
+            shift += 1
+            continue
+
+        factor = discrepancy * pow(last_discrepancy, -1, modulus) % modulus
+        previous = connection.copy()
+        connection[shift:] = (connection[shift:] - factor * before[: n + 1 - shift]) % modulus
+        if 2 * length <= i:
+            length, before, last_discrepancy, shift = i + 1 - length, previous, discrepancy, 1
+        else:
+            shift += 1
+    return -connection[1 : length + 1] % modulus
+
+
+def power_of_x(exponent: int, recurrence: np.ndarray, modulus: int) -> np.ndarray:
+    """
+    Compute x**exponent modulo the characteristic polynomial x**L - c[0] * x**(L - 1) - ... - c[L - 1] of a linear
+    recurrence, by exponentiation by squaring. Since the recurrence maps x**L to a combination of lower powers, the
+    n-th term of the sequence is then the same combination of its first L terms.
+    """
+    reversed_recurrence = recurrence[::-1]
+    length = len(recurrence)
+
+    def reduce(polynomial: np.ndarray) -> np.ndarray:
+        # replace the highest power x**d by c[0] * x**(d - 1) + ... + c[L - 1] * x**(d - L) until the degree is < L
+        for degree in range(len(polynomial) - 1, length - 1, -1):
+            if coefficient := int(polynomial[degree]):
+                window = polynomial[degree - length : degree]
+                window += coefficient * reversed_recurrence
+                window %= modulus
+        return polynomial[:length]
+
+    result = np.ones(1, dtype=np.int64)
+    for bit in bin(exponent)[2:]:
+        result = reduce(mod_convolve(result, result, modulus))
+        if bit == "1":
+            result = reduce(np.concatenate([np.zeros(1, dtype=np.int64), result]))
+    return result
+
+
+class StoneTransitions:
+    """
+    Blinking as a linear map on the closed set of stone values reachable from some initial stones: the stone counts
+    after a blink are the counts before it times a sparse transition matrix. Stone totals therefore follow a linear
+    recurrence of order at most the number of values, which lets us jump to any blink count in O(log blinks) steps.
+    """
+
+    def __init__(self, stones: Iterable[int]) -> None:
+        self.stones = Counter(stones)
+        self.values = closed_values(self.stones)
+        index = {value: i for i, value in enumerate(self.values)}
 
-def part1(stones: PuzzleInput, blinks: int = 25) -> int:
-    return sum(expands_to(stone, blinks) for stone in stones)
+        # matrix[i, j] = how many stones of value j a single stone of value i turns into in one blink
+        edges = [(index[value], index[successor]) for value in self.values for successor in successors(value)]
+        rows, columns = np.array(edges, dtype=np.int64).reshape(-1, 2).T
+        self.matrix = csr_array(
+            (np.ones(len(rows), dtype=np.int64), (rows, columns)), shape=(len(self.values), len(self.values))
+        )
+        self.initial_counts = np.array([self.stones[value] for value in self.values], dtype=np.int64)
 
+        # recurrence of the stone totals, and the first terms of the sequence, for every modulus used so far
+        self.recurrences: dict[int, tuple[np.ndarray, np.ndarray]] = {}
 
+    def totals(self, blinks: int, modulus: int) -> np.ndarray:
+        """The total number of stones after 0, 1, ..., blinks - 1 blinks, modulo a prime"""
+        counts = self.initial_counts % modulus
+        totals = np.zeros(blinks, dtype=np.int64)
+        for i in range(blinks):
+            totals[i] = counts.sum() % modulus
+            counts = (counts @ self.matrix) % modulus
+        return totals
+
+    def recurrence(self, modulus: int) -> tuple[np.ndarray, np.ndarray]:
+        if modulus not in self.recurrences:
+            sequence = self.totals(2 * len(self.values), modulus)
+            self.recurrences[modulus] = sequence, berlekamp_massey(sequence, modulus)
+        return self.recurrences[modulus]
+
+    def count_modulo(self, blinks: int, modulus: int) -> int:
+        """The number of stones after the given number of blinks, modulo a prime < 2**31"""
+        check_modulus(modulus)
+        sequence, recurrence = self.recurrence(modulus)
+        if blinks < len(sequence):
+            return int(sequence[blinks])
+        if len(recurrence) == 0:  # the sequence is all zeros
+            return 0
+        return mod_dot(power_of_x(blinks, recurrence, modulus), sequence[: len(recurrence)], modulus)
+
+    def count(self, blinks: int) -> int:
+        """
+        The exact number of stones after the given number of blinks. The count grows exponentially, so its size in
+        bits (and the cost of every addition) grows linearly with the number of blinks, which limits exact counts to
+        blink counts we can simulate anyways. Blinking one blink after the other is the fastest way to get them.
+        """
+        return blink_times(self.stones.elements(), blinks).total()
+
+
+@profiled
+def part1(stones: PuzzleInput, blinks: int = 25, modulus: int | None = None) -> int:
+    """
+    Count the stones after the given number of blinks. Given a prime modulus, the count modulo that prime is computed
+    using the transition matrix instead, which works for blink counts far beyond what we can simulate, such as 10**12.
+    """
+    if modulus is not None:
+        return StoneTransitions(stones).count_modulo(blinks, modulus)
+    return blink_times(stones, blinks).total()
+
+
+@profiled
 def part2(stones: PuzzleInput) -> int:
     return part1(stones, 75)
 
@@ -73,3 +282,27 @@ def test_part2(puzzle_input: PuzzleInput) -> None:
 
 def test_example_part2(example_input: PuzzleInput) -> None:
     assert part2(example_input) == 65601038650482
+
+
+def test_many_blinks() -> None:
+    assert split_digits(1000) == (10, 0)
+    assert split_digits(123) is None
+    assert expands_to(0, 0) == 1
+    assert expands_to(125, 6) == 7
+    # no recursion involved, so we can blink for a long time
+    assert len(str(part1([125, 17], 10_000))) > 1000
+
+
+def test_transition_matrix() -> None:
+    stones = [125, 17, 0, 2024]
+    transitions = StoneTransitions(stones)
+    for blinks in [0, 1, 25, 75, 200, 1000]:
+        expected = blink_times(stones, blinks).total()
+        assert transitions.count(blinks) == expected
+        assert transitions.count_modulo(blinks, MAX_MODULUS) == expected % MAX_MODULUS
+        assert part1(stones, blinks, modulus=1_000_003) == expected % 1_000_003
+
+    # far more blinks than we could ever simulate
+    assert 0 <= transitions.count_modulo(10**12, MAX_MODULUS) < MAX_MODULUS
+    with pytest.raises(ValueError, match="prime"):
+        transitions.count_modulo(10, 1_000_000)
@@ -1,70 +1,241 @@
-from collections.abc import Iterator
-from itertools import pairwise
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from mmap import ACCESS_READ, mmap
+from pathlib import Path
 
 import numpy as np
 import pytest
 from aocd.models import Puzzle
-from scipy.ndimage import label
-from shapely import LineString, MultiLineString, Polygon, box, union_all
+from scipy.sparse import csr_array
+from scipy.sparse.csgraph import connected_components
 
+from aoc.grid import DIRECTIONS, GridGraph, load_grid
+from aoc.profiling import profiled
 
+MEMORY_BUDGET = 8 << 20
+
+# plant value for everything outside of the garden, different from all actual plants
+OUTSIDE = -1
+
+
+@profiled
 def parse(data: str) -> np.ndarray:
-    # convert letters to numbers using ord (their ascii value)
-    return np.asarray([[ord(ch) for ch in l] for l in data.strip().splitlines()])
-
-
-def iterate_regions(garden: np.ndarray) -> Iterator[Polygon]:
-    """Iterate over all connected regions of the same value, yielding them as shapely.Polygons."""
-    plants = np.unique(garden)
-    for plant in plants:
-        current_plant_mask = garden == plant  # boolean mask indicating all cells containing the current plant
-        # label all connected regions:
-        plant_regions, num = label(current_plant_mask)  # type: ignore[arg-type]
-        for i in range(1, num + 1):
-            region = plant_regions == i  # find all cells belonging to the current region
-            # construct square boxes for every cell in the current region
-            polys = [box(x, y, x + 1, y + 1) for y, x in zip(*np.where(region), strict=True)]
-            # and then combine them into a single polygon
-            region = union_all(polys)
-            if not isinstance(region, Polygon):
-                raise TypeError("Region is not a polygon")
-            yield region
-
-
-def count_sides(region: Polygon) -> int:
+    # letters as numbers (their ascii value)
+    return load_grid(data)
+
+
+@dataclass(frozen=True)
+class RegionStats:
+    """Area, perimeter and number of sides of every region of a garden, indexed by region label"""
+
+    area: np.ndarray
+    perimeter: np.ndarray
+    sides: np.ndarray
+
+
+def label_regions(garden: np.ndarray) -> tuple[int, np.ndarray]:
+    """
+    Label all connected regions of the same plant at once, as components of the graph between equal neighbours
+
+    Returns:
+        The number of regions, and the region label of every cell
+    """
+    return GridGraph.from_grid(garden, np.equal).connected_components()
+
+
+def is_corner(vertical: np.ndarray, horizontal: np.ndarray, diagonal: np.ndarray) -> np.ndarray:
+    """
+    Whether cells have a corner at one of their vertices, given whether the vertical, horizontal and diagonal neighbour
+    in the 2x2 window around that vertex belong to a different region: a convex corner if both the vertical and
+    horizontal one do, a concave corner if neither of them does but the diagonal one does.
+    """
+    return (vertical & horizontal) | (~vertical & ~horizontal & diagonal)
+
+
+def region_stats(garden: np.ndarray) -> RegionStats:
+    """
+    Compute area, perimeter and sides of all regions in one vectorized pass over the garden.
+
+    The perimeter of a region is the number of cell edges between one of its cells and a different region (or the
+    outside of the garden), and the number of its sides equals the number of its corners. Looking at the 2x2 window
+    around each corner of a cell, the cell has a convex corner there if both its neighbours in the window belong to
+    different regions, and a concave corner if both belong to the same region but the diagonal cell does not.
+    """
+    num_regions, labels = label_regions(garden)
+    height, width = labels.shape
+    # pad with a label no region has, so the outside of the garden counts as a different region
+    padded = np.pad(labels, 1, constant_values=-1)
+
+    def neighbour(dy: int, dx: int) -> np.ndarray:
+        return padded[1 + dy : 1 + dy + height, 1 + dx : 1 + dx + width]
+
+    # for every cell, whether its neighbour in each direction belongs to a different region
+    differs = {(dy, dx): neighbour(dy, dx) != labels for dy, dx in DIRECTIONS}
+    edges = np.sum([differs[direction] for direction in DIRECTIONS], axis=0)
+
+    corners = np.zeros_like(labels)
+    for dy, dx in [(-1, -1), (-1, 1), (1, -1), (1, 1)]:
+        corners += is_corner(differs[dy, 0], differs[0, dx], neighbour(dy, dx) != labels)
+
+    return RegionStats(
+        area=np.bincount(labels.ravel(), minlength=num_regions),
+        perimeter=np.bincount(labels.ravel(), weights=edges.ravel(), minlength=num_regions).astype(np.int64),
+        sides=np.bincount(labels.ravel(), weights=corners.ravel(), minlength=num_regions).astype(np.int64),
+    )
+
+
+def row_edges(row: np.ndarray, across: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Edges and corners of the cells of a row, towards an adjacent row. Both rows are padded with the outside.
+
+    Returns:
+        The number of edges towards the adjacent row, the number of edges within the row, and the number of corners
+        at the vertices shared with the adjacent row, for every cell
+    """
+    cells = row[1:-1]
+    vertical, left, right = cells != across[1:-1], cells != row[:-2], cells != row[2:]
+    corners = is_corner(vertical, left, across[:-2] != cells).astype(np.int64) + is_corner(
+        vertical, right, across[2:] != cells
+    )
+    return vertical.astype(np.int64), left.astype(np.int64) + right, corners
+
+
+@dataclass
+class Region:
+    plant: int
+    area: int
+    perimeter: int
+    sides: int
+
+
+class RegionStream:
     """
-    Count the number of sides of the given region. A region may have holes in it, which need to be counted as well.
+    Analyze a garden one row at a time, without ever holding more than two rows in memory. Every row, the runs of the
+    same plant within it are merged with the regions of the same plant directly above them, as connected components
+    of a graph between the runs and the regions of the previous row. Regions are emitted as soon as a row no longer
+    contains any of their cells, so memory stays in O(width), and all work per row is vectorized.
+
+    Neighbouring cells of the same plant always belong to the same region, which also holds for the diagonal cell in a
+    concave corner. So edges and corners can be counted by comparing plants instead of region labels, which lets us
+    count them for the previous row as soon as the next one arrives.
     """
-    perimeter = region.boundary
-    if isinstance(perimeter, MultiLineString):  # a region with holes
-        return sum(count_turns(line) for line in perimeter.geoms)  # count the main region and all holes
 
-    return count_turns(perimeter)
+    def __init__(self) -> None:
+        # the previous row padded with the outside on both sides, and the region of each of its cells
+        self.previous = np.full(2, OUTSIDE, dtype=np.int16)
+        self.labels = np.zeros(0, dtype=np.int64)
+        # the plant, and the area, perimeter and sides counted so far, of every region in the previous row
+        self.plants = np.zeros(0, dtype=np.int64)
+        self.stats = np.zeros((3, 0), dtype=np.int64)
+
+    def feed(self, row: bytes) -> list[Region]:
+        """
+        Process the next row of the garden
+
+        Returns:
+            All regions which are complete now, because this row does not continue them
+        """
+        plants = np.frombuffer(row, dtype=np.uint8)
+        if len(self.labels) == 0:  # the first row, the garden is surrounded by the outside
+            self.previous = np.full(len(plants) + 2, OUTSIDE, dtype=np.int16)
+        elif len(plants) != len(self.labels):
+            raise ValueError(f"Row of length {len(plants)} in a garden of width {len(self.labels)}")
+        current = np.pad(plants.astype(np.int16), 1, constant_values=OUTSIDE)
+
+        # the nodes of the graph are the regions of the previous row, followed by the runs of the current row
+        run_starts = current[1:-1] != current[:-2]
+        runs = len(self.plants) + np.cumsum(run_starts) - 1
+        nodes = len(self.plants) + int(run_starts.sum())
+        edges = runs[:0], runs[:0]  # between each run and the regions of the same plant directly above it
+        if len(self.labels) > 0:
+            above = current[1:-1] == self.previous[1:-1]
+            edges = runs[above], self.labels[above]
+        # runs are numbered from left to right, so the edges are already sorted by run, as needed for the csr format
+        indptr = np.searchsorted(edges[0], np.arange(nodes + 1))
+        graph = csr_array((np.ones(len(edges[1]), dtype=np.int8), edges[1], indptr), shape=(nodes, nodes))
+        _, components = connected_components(graph, directed=False)
+
+        # all nodes of a component have the same plant, since only runs of the same plant as above are connected
+        node_plants = np.concatenate([self.plants, plants[run_starts]])
+        component_plants = np.zeros(components.max(initial=-1) + 1, dtype=np.int64)
+        component_plants[components] = node_plants
+        return self.advance(current, components[runs], components[: len(self.plants)], component_plants)
 
+    def finish(self) -> list[Region]:
+        """Process the end of the garden, which completes all remaining regions"""
+        previous_regions = np.arange(len(self.plants))
+        return self.advance(
+            np.full_like(self.previous, OUTSIDE), np.zeros(0, dtype=np.int64), previous_regions, self.plants
+        )
 
-def count_turns(line_string: LineString) -> int:
-    """Count the number of turns in the given linestring."""
-    coords = list(line_string.coords)
-    turns = 0
-    # initialize direction with the last direction we'll have, so we also account for the very first turn
-    direction = (coords[-1][0] - coords[-2][0], coords[-1][1] - coords[-2][1])
+    def advance(self, current: np.ndarray, labels: np.ndarray, merged: np.ndarray, plants: np.ndarray) -> list[Region]:
+        """
+        Count the edges and corners between the previous and the current row, given the region of every cell of the
+        current row, the region each region of the previous row was merged into, and the plant of every region
+        """
+        weights = [self.stats, np.zeros((3, 0), dtype=np.int64), np.zeros((3, 0), dtype=np.int64)]
+        regions = [merged, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)]
+        previous_labels = merged[self.labels]
+        if len(labels) > 0:  # the area, left, right and top edges, and top corners of the current row
+            vertical, horizontal, corners = row_edges(current, self.previous)
+            weights[1], regions[1] = np.stack([np.ones_like(labels), vertical + horizontal, corners]), labels
+        if len(previous_labels) > 0:  # the bottom edges and bottom corners of the previous row
+            vertical, _, corners = row_edges(self.previous, current)
+            weights[2], regions[2] = np.stack([np.zeros_like(vertical), vertical, corners]), previous_labels
+        region, weight = np.concatenate(regions), np.concatenate(weights, axis=1)
+        stats = np.stack([np.bincount(region, weights=w, minlength=len(plants)) for w in weight]).astype(np.int64)
+
+        # regions which do not continue into the current row are complete, the others are relabeled to stay compact
+        live = np.zeros(len(plants), dtype=bool)
+        live[labels] = True
+        closed = [Region(*values) for values in zip(plants[~live].tolist(), *stats[:, ~live].tolist(), strict=True)]
+        self.previous, self.labels = current, (np.cumsum(live) - 1)[labels]
+        self.plants, self.stats = plants[live], stats[:, live]
+        return closed
+
+
+def read_rows(source: Path | bytes | mmap) -> Iterator[bytes]:
+    """Read a garden one row at a time, from a file or a (memory mapped) buffer"""
+    if isinstance(source, Path):
+        with source.open("rb") as f:
+            yield from f
+        return
+    start = 0
+    while start < len(source):
+        end = source.find(b"\n", start)
+        end = len(source) if end < 0 else end
+        yield source[start:end]
+        start = end + 1
+
+
+def stream_regions(rows: Iterable[bytes]) -> Iterator[Region]:
+    """Iterate over all regions of a garden given row by row, see RegionStream"""
+    stream = RegionStream()
+    for row in rows:
+        if row := row.rstrip(b"\r\n"):
+            yield from stream.feed(row)
+    yield from stream.finish()
 
-    # the linestring is closed, with the first coordinate appearing again at the end, so this iterates all pairs:
-    for a, b in pairwise(coords):
-        current_dir = (b[0] - a[0], b[1] - a[1])
-        # whenever we take a corner (the direction between successive points changes) -> new side
-        if current_dir != direction:
-            turns += 1
-        direction = current_dir
-    return turns
 
+def price_file(path: Path) -> tuple[int, int]:
+    """The total price of fencing all regions of a garden in a file, without loading it into memory, for both parts"""
+    price, discounted_price = 0, 0
+    for region in stream_regions(read_rows(path)):
+        price += region.area * region.perimeter
+        discounted_price += region.area * region.sides
+    return price, discounted_price
 
+
+@profiled
 def part1(garden: np.ndarray) -> int:
-    return sum(int(region.area) * int(region.length) for region in iterate_regions(garden))
+    stats = region_stats(garden)
+    return int(stats.area @ stats.perimeter)
 
 
+@profiled
 def part2(garden: np.ndarray) -> int:
-    return sum(int(region.area) * count_sides(region) for region in iterate_regions(garden))
+    stats = region_stats(garden)
+    return int(stats.area @ stats.sides)
 
 
 @pytest.fixture
@@ -104,3 +275,30 @@ def test_part2(puzzle_input: np.ndarray) -> None:
 
 def test_example_part2(example_input: np.ndarray) -> None:
     assert part2(example_input) == 1206
+
+
+def test_region_stats() -> None:
+    # an A region with a hole, containing a single B
+    stats = region_stats(parse("AAA\nABA\nAAA"))
+    assert sorted(zip(stats.area.tolist(), stats.perimeter.tolist(), stats.sides.tolist(), strict=True)) == [
+        (1, 4, 4),
+        (8, 16, 8),
+    ]
+    # regions only touching diagonally are separate regions
+    assert len(region_stats(parse("AB\nBA")).area) == 4
+
+
+def test_stream_regions(tmp_path: Path) -> None:
+    rng = np.random.default_rng(12)
+    garden = rng.choice(np.frombuffer(b"ABC", dtype=np.uint8), size=(40, 30))
+    data = b"\n".join(row.tobytes() for row in garden) + b"\n"
+
+    stats = region_stats(garden)
+    expected = sorted(zip(stats.area.tolist(), stats.perimeter.tolist(), stats.sides.tolist(), strict=True))
+    regions = list(stream_regions(read_rows(data)))
+    assert sorted((region.area, region.perimeter, region.sides) for region in regions) == expected
+
+    (tmp_path / "garden.txt").write_bytes(data)
+    assert price_file(tmp_path / "garden.txt") == (part1(garden), part2(garden))
+    with (tmp_path / "garden.txt").open("rb") as f, mmap(f.fileno(), 0, access=ACCESS_READ) as memory:
+        assert len(list(stream_regions(read_rows(memory)))) == len(regions)
@@ -1,71 +1,106 @@
-import re
-from dataclasses import dataclass
-from typing import Self, TypeAlias
+from typing import TypeAlias
 
+import numpy as np
 import pytest
 from aocd.models import Puzzle
-from sympy import Eq, solve, symbols
 
+from aoc.parsing import extract_int_table
+from aoc.profiling import profiled
 
-@dataclass(frozen=True)
-class Vec2:
-    x: int
-    y: int
+# columns of the machine array: the movement of button a and b, and the prize position, as x and y each
+AX, AY, BX, BY, PX, PY = range(6)
 
-    @classmethod
-    def parse(cls, line: str) -> Self:
-        x, y = map(int, re.findall(r"\d+", line))
-        return cls(x, y)
+# the prizes are actually much further away in part 2
+PRIZE_OFFSET = 10000000000000
 
-    def __add__(self, other: "Vec2") -> "Vec2":
-        return Vec2(self.x + other.x, self.y + other.y)
+MEMORY_BUDGET = 1 << 20
 
-
-@dataclass(frozen=True)
-class ClawMachine:
-    button_a: Vec2
-    button_b: Vec2
-    prize: Vec2
-
-    @classmethod
-    def parse(cls, machine_data: str) -> Self:
-        a, b, prize = machine_data.strip().split("\n")
-        return cls(Vec2.parse(a), Vec2.parse(b), Vec2.parse(prize))
-
-    def shift_prize(self, offset: Vec2) -> "ClawMachine":
-        return ClawMachine(self.button_a, self.button_b, self.prize + offset)
-
-
-PuzzleInput: TypeAlias = list[ClawMachine]
+# one claw machine per row, see the column indices above
+PuzzleInput: TypeAlias = np.ndarray
 
 
+@profiled
 def parse(data: str) -> PuzzleInput:
-    return [ClawMachine.parse(machine_data) for machine_data in data.strip().split("\n\n")]
-
-
-def solve_linear_equation(machine: ClawMachine) -> int:
-    a, b = symbols("a b", integer=True)
-    eq1 = Eq(machine.button_a.x * a + machine.button_b.x * b, machine.prize.x)
-    eq2 = Eq(machine.button_a.y * a + machine.button_b.y * b, machine.prize.y)
-
-    # Solve the system of equations for a and b
-    solution = solve((eq1, eq2), (a, b))
-    if not isinstance(solution, list):  # for one solution sympy returns a single solution instead of a list
-        solution = [solution]
-
-    if len(solution) == 0:
-        return 0  # no solution
-
-    return min(3 * int(sol[a]) + int(sol[b]) for sol in solution)
-
-
+    return extract_int_table(data, columns=6)
+
+
+def solve_collinear(u: int, v: int, w: int) -> int | None:
+    """
+    Find the minimum cost 3 * a + b of pressing the buttons a and b times, such that a * u + b * v = w, for button
+    moves u, v >= 0 along the same line.
+
+    All solutions of a * u + b * v = w are a = a0 + k * v / g, b = b0 - k * u / g with g = gcd(u, v) and a single
+    solution (a0, b0) from the extended euclidean algorithm. The cost changes linearly in k, so the minimum is at one
+    end of the range of k for which neither a nor b is negative.
+    """
+    if u == 0 or v == 0:  # only one of the buttons moves the claw, so we only press that one
+        move, cost = (v, 1) if u == 0 else (u, 3)
+        if move == 0:
+            return 0 if w == 0 else None
+        return cost * (w // move) if w % move == 0 and w >= 0 else None
+
+    g, x, y = extended_gcd(u, v)
+    if w % g != 0:
+        return None
+    a0, b0, step_a, step_b = x * (w // g), y * (w // g), v // g, u // g
+    low, high = -(a0 // step_a), b0 // step_b  # the range of k for which a >= 0 and b >= 0
+    if low > high:
+        return None
+    k = low if 3 * step_a > step_b else high
+    return 3 * (a0 + k * step_a) + (b0 - k * step_b)
+
+
+def extended_gcd(a: int, b: int) -> tuple[int, int, int]:
+    """Find g = gcd(a, b) together with x and y such that a * x + b * y = g"""
+    x0, y0, x1, y1 = 1, 0, 0, 1
+    while b != 0:
+        q, a, b = a // b, b, a % b
+        x0, x1 = x1, x0 - q * x1
+        y0, y1 = y1, y0 - q * y1
+    return a, x0, y0
+
+
+def min_tokens(machines: np.ndarray, prize_offset: int = 0) -> np.ndarray:
+    """
+    Solve the equations a * button_a + b * button_b = prize of all machines at once using Cramer's rule
+
+    Returns:
+        The minimum number of tokens needed to win the prize of each machine, 0 if it can't be won
+    """
+    buttons, prizes = machines[:, :PX], machines[:, PX:] + prize_offset
+    # the products in Cramer's rule need to fit into an int64, otherwise we fall back to python ints
+    largest_button, largest_prize = int(np.abs(buttons).max(initial=0)), int(np.abs(prizes).max(initial=0))
+    if 2 * largest_button * max(largest_button, largest_prize) >= 1 << 63:
+        buttons, prizes = buttons.astype(object), prizes.astype(object)
+
+    ax, ay, bx, by = buttons.T
+    px, py = prizes.T
+    det = ax * by - ay * bx
+    collinear = det == 0
+    det[collinear] = 1  # solved separately below
+    numerator_a, numerator_b = px * by - py * bx, ax * py - ay * px
+    a, b = numerator_a // det, numerator_b // det
+    solvable = ~collinear & (numerator_a % det == 0) & (numerator_b % det == 0) & (a >= 0) & (b >= 0)
+    tokens = np.where(solvable, 3 * a + b, 0)
+
+    # if both buttons move along the same line, the prize needs to be on that line too, then only one axis matters
+    for i in np.flatnonzero(collinear):
+        axis = 0 if ax[i] != 0 or bx[i] != 0 else 1
+        u, v, w = int(buttons[i, axis]), int(buttons[i, 2 + axis]), int(prizes[i, axis])
+        on_line = ax[i] * py[i] == ay[i] * px[i] and bx[i] * py[i] == by[i] * px[i]
+        cost = solve_collinear(u, v, w) if on_line else None
+        tokens[i] = cost or 0
+    return tokens
+
+
+@profiled
 def part1(machines: PuzzleInput) -> int:
-    return sum(solve_linear_equation(m) for m in machines)
+    return sum(min_tokens(machines).tolist())
 
 
+@profiled
 def part2(machines: PuzzleInput) -> int:
-    offset = 10000000000000
-    return sum(solve_linear_equation(m.shift_prize(Vec2(offset, offset))) for m in machines)
+    return sum(min_tokens(machines, PRIZE_OFFSET).tolist())
 
 
 @pytest.fixture
@@ -110,3 +145,21 @@ def test_part2(puzzle_input: PuzzleInput) -> None:
 
 def test_example_part2(example_input: PuzzleInput) -> None:
     assert part2(example_input) == 875318608908
+
+
+def test_collinear_buttons() -> None:
+    # a moves four times as far as b, for only three times the cost
+    assert solve_collinear(4, 1, 8) == 3 * 2
+    # b moves twice as far as a, for a third of the cost
+    assert solve_collinear(2, 4, 10) == 3 + 2
+    assert solve_collinear(4, 6, 7) is None
+    assert solve_collinear(0, 5, 10) == 2
+    machines = np.array([[2, 2, 4, 4, 10, 10], [2, 2, 4, 4, 10, 11], [1, 0, 0, 0, 5, 0]])
+    assert min_tokens(machines).tolist() == [5, 0, 15]
+
+
+def test_overflow() -> None:
+    # products of these exceed the range of int64
+    a, b = (3 * 10**9, 1), (1, 3 * 10**9)
+    machines = np.array([[*a, *b, 5 * a[0] + 7 * b[0], 5 * a[1] + 7 * b[1]]])
+    assert min_tokens(machines).tolist() == [3 * 5 + 7]
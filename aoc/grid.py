@@ -0,0 +1,175 @@
+from collections.abc import Buffer, Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Self
+
+import numpy as np
+import pytest
+from scipy.sparse import csr_array
+from scipy.sparse.csgraph import connected_components
+
+# the four neighbours of a grid cell, as (dy, dx)
+DIRECTIONS = [(-1, 0), (0, 1), (1, 0), (0, -1)]
+
+NEWLINE = ord("\n")
+WHITESPACE = frozenset(b" \t\r\n")
+
+# decides for arrays of source and destination cell values whether there is an edge between them
+EdgePredicate = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+def load_grid(source: str | Buffer | Path) -> np.ndarray:
+    """
+    Load a grid of characters as a (height, width) uint8 array of their ascii values, without copying the input.
+    The input bytes are viewed as rows of width + 1 bytes, from which the newline column is dropped. Files are memory
+    mapped, so only the parts of a grid that are actually accessed are ever read into memory.
+    """
+    if isinstance(source, Path):
+        buffer = np.memmap(source, dtype=np.uint8, mode="r")
+    else:
+        buffer = np.frombuffer(source.encode() if isinstance(source, str) else source, dtype=np.uint8)
+
+    # ignore whitespace around the grid, like str.strip
+    start, end = 0, len(buffer)
+    while start < end and buffer[start] in WHITESPACE:
+        start += 1
+    while end > start and buffer[end - 1] in WHITESPACE:
+        end -= 1
+    buffer = buffer[start:end]
+
+    newlines = np.flatnonzero(buffer[: min(len(buffer), 1 << 16)] == NEWLINE)
+    width = int(newlines[0]) if len(newlines) > 0 else len(buffer)
+    height = (len(buffer) + 1) // (width + 1)
+    if height * (width + 1) != len(buffer) + 1 or np.any(buffer[width :: width + 1] != NEWLINE):
+        raise ValueError("All rows of a grid need to have the same length")
+    # view the bytes as rows of width + 1 (with the last row missing its newline), and skip the newline column
+    return np.lib.stride_tricks.as_strided(buffer, shape=(height, width), strides=(width + 1, 1), writeable=False)
+
+
+@dataclass(frozen=True)
+class GridGraph:
+    """
+    A directed graph between neighbouring cells of a 2D grid, in compressed sparse row (CSR) format. Cells are
+    identified by their index into the flattened grid, and the neighbours of cell i are indices[indptr[i]:indptr[i + 1]]
+    """
+
+    shape: tuple[int, int]
+    indptr: np.ndarray
+    indices: np.ndarray
+
+    @classmethod
+    def from_grid(cls, grid: np.ndarray, edge: EdgePredicate) -> Self:
+        """
+        Build the graph of all edges between neighbouring cells for which the edge predicate holds, e.g.
+        `lambda src, dst: src + 1 == dst` for edges into cells exactly one higher than the source cell
+        """
+        height, width = grid.shape
+        cells = np.arange(height * width).reshape(height, width)
+        sources, targets = [], []
+        for dy, dx in DIRECTIONS:
+            # all cells which have a neighbour in this direction, and that neighbour
+            src = cells[max(0, -dy) : height - max(0, dy), max(0, -dx) : width - max(0, dx)].ravel()
+            dst = src + dy * width + dx
+            keep = edge(grid.flat[src], grid.flat[dst])
+            sources.append(src[keep])
+            targets.append(dst[keep])
+
+        src, dst = np.concatenate(sources), np.concatenate(targets)
+        order = np.argsort(src, kind="stable")
+        indptr = np.zeros(height * width + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=height * width), out=indptr[1:])
+        return cls((height, width), indptr, dst[order].astype(np.int32))
+
+    @property
+    def num_cells(self) -> int:
+        return len(self.indptr) - 1
+
+    def neighbours(self, cells: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the neighbours of all given cells at once
+
+        Returns:
+            The neighbours, together with the index into cells of the cell each neighbour belongs to
+        """
+        starts, counts = self.indptr[cells], np.diff(self.indptr)[cells]
+        owner = np.repeat(np.arange(len(cells)), counts)
+        # position of every edge within the neighbours of its cell
+        offsets = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return self.indices[starts[owner] + offsets], owner
+
+    def reduce_neighbours(self, values: np.ndarray, ufunc: np.ufunc, cells: np.ndarray) -> np.ndarray:
+        """
+        Combine the values of all neighbours of each of the given cells with a ufunc, e.g. np.add to sum them up.
+        Values may have additional trailing dimensions. Cells without neighbours get the identity of the ufunc.
+        """
+        neighbours, owner = self.neighbours(cells)
+        reduced = np.full((len(cells), *values.shape[1:]), ufunc.identity, dtype=values.dtype)
+        has_neighbours = np.diff(self.indptr)[cells] > 0
+        if neighbours.size > 0:
+            starts = np.searchsorted(owner, np.flatnonzero(has_neighbours))
+            reduced[has_neighbours] = ufunc.reduceat(values[neighbours], starts, axis=0)
+        return reduced
+
+    def bfs(self, sources: np.ndarray) -> np.ndarray:
+        """
+        Breadth first search from all sources at once, expanding a whole frontier per step
+
+        Returns:
+            The distance of every cell to the closest source, -1 for unreachable cells
+        """
+        distances = np.full(self.num_cells, -1, dtype=np.int32)
+        frontier = np.unique(sources)
+        distance = 0
+        while len(frontier) > 0:
+            distances[frontier] = distance
+            neighbours, _ = self.neighbours(frontier)
+            frontier = np.unique(neighbours[distances[neighbours] < 0])
+            distance += 1
+        return distances
+
+    def reachable(self, sources: np.ndarray) -> np.ndarray:
+        """A boolean mask (in the shape of the grid) of all cells reachable from any of the sources"""
+        return (self.bfs(sources) >= 0).reshape(self.shape)
+
+    def connected_components(self) -> tuple[int, np.ndarray]:
+        """
+        Label the (weakly) connected components of the graph
+
+        Returns:
+            The number of components, and the component label of every cell in the shape of the grid
+        """
+        matrix = csr_array(
+            (np.ones(len(self.indices), dtype=np.int8), self.indices, self.indptr), shape=(self.num_cells,) * 2
+        )
+        num_components, labels = connected_components(matrix, directed=True, connection="weak")
+        return num_components, labels.reshape(self.shape)
+
+
+def test_grid_graph() -> None:
+    grid = np.array(
+        [
+            [0, 1, 2],
+            [5, 4, 3],
+            [6, 0, 0],
+        ]
+    )
+    graph = GridGraph.from_grid(grid, lambda src, dst: src + 1 == dst)
+    assert graph.bfs(np.array([0])).reshape(grid.shape).tolist() == [[0, 1, 2], [5, 4, 3], [6, -1, -1]]
+    assert graph.reachable(np.array([4])).sum() == 3
+    assert graph.reduce_neighbours(grid.ravel(), np.add, np.arange(9)).tolist() == [1, 2, 3, 6, 5, 4, 0, 0, 0]
+
+    num_components, labels = GridGraph.from_grid(grid, np.equal).connected_components()
+    assert num_components == 8
+    assert labels[2, 1] == labels[2, 2]
+
+
+def test_load_grid(tmp_path: Path) -> None:
+    grid = load_grid("\nab\ncd\n")
+    assert grid.dtype == np.uint8
+    assert grid.tolist() == [[ord("a"), ord("b")], [ord("c"), ord("d")]]
+    assert load_grid(b"abc").shape == (1, 3)
+
+    (tmp_path / "grid.txt").write_bytes(b"ab\ncd\nef\n")
+    assert load_grid(tmp_path / "grid.txt")[2].tobytes() == b"ef"
+    with pytest.raises(ValueError, match="same length"):
+        load_grid("ab\ncde")
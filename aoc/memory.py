@@ -0,0 +1,100 @@
+"""
+Memory instrumentation for the phases of every day, built on tracemalloc: the peak memory of a phase, and the sites
+which allocated the most memory still held at its end (such as caches and results). With python -m aoc --memory, this
+is reported for each phase.
+
+Every day with an input generator in aoc.benchmark declares a module level MEMORY_BUDGET: the peak memory in bytes any
+of its phases may use on a generated input of the size of the actual puzzle input. The budgets leave about 3x headroom
+over the peaks measured when they were set, and test_memory_budget fails as soon as a phase exceeds its budget.
+"""
+
+import gc
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+import pytest
+
+from aoc.benchmark import GENERATORS
+from aoc.runner import PARTS, load_day
+
+# how many allocation sites are reported per phase
+TOP_SITES = 10
+
+
+@dataclass(frozen=True)
+class MemoryUsage:
+    peak: int  # the highest amount of memory allocated at once during the phase, in bytes
+    sites: list[tuple[str, int]]  # the allocation sites ("file:line") with the most memory still held, in bytes
+
+    def to_json(self) -> dict[str, Any]:
+        return {"peak": self.peak, "sites": [{"site": site, "size": size} for site, size in self.sites]}
+
+
+def measure(function: Callable[..., Any], *args: Any, top: int = TOP_SITES) -> tuple[Any, MemoryUsage]:
+    """
+    Call a function while tracing its memory allocations
+
+    Returns:
+        The result of the call, and its memory usage
+    """
+    gc.collect()  # so garbage left behind by earlier calls isn't freed in the middle of this one
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    # ignore the allocations of tracemalloc itself, like the snapshot taken before
+    ignore = [tracemalloc.Filter(inclusive=False, filename_pattern=tracemalloc.__file__)]
+    growth = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+    sites = [(f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", stat.size_diff) for stat in growth]
+    sites = sorted((site for site in sites if site[1] > 0), key=lambda site: -site[1])[:top]
+    return result, MemoryUsage(peak - baseline, sites)
+
+
+def measure_day(day: int, data: str) -> dict[str, MemoryUsage]:
+    """Measure the memory usage of parse, part1 and part2 of a day on the given input"""
+    module = load_day(day)
+    puzzle_input, parse_usage = measure(module.parse, data)
+    args = puzzle_input if isinstance(puzzle_input, tuple) else (puzzle_input,)
+    usage = {"parse": parse_usage}
+    for part in PARTS:
+        _, usage[part] = measure(getattr(module, part), *args)
+    return usage
+
+
+def test_measure() -> None:
+    _, usage = measure(np.zeros, 1 << 20)
+    assert usage.peak >= 8 << 20
+    assert any(size >= 8 << 20 for _, size in usage.sites)  # the result is still held after the call
+    _, usage = measure(lambda: np.zeros(1 << 20).sum())
+    assert usage.peak >= 8 << 20
+    assert all(size < 1 << 20 for _, size in usage.sites)
+
+
+def test_repeatable() -> None:
+    # without caches outliving a call, a day uses the same memory no matter what ran before it
+    data = GENERATORS[11](np.random.default_rng(0), 1)
+    first, second = measure_day(11, data), measure_day(11, data)
+    for phase, usage in first.items():
+        assert second[phase].peak == pytest.approx(usage.peak, rel=0.1)
+
+
+@pytest.mark.parametrize("day", sorted(GENERATORS))
+def test_memory_budget(day: int) -> None:
+    budget = load_day(day).MEMORY_BUDGET
+    usage = measure_day(day, GENERATORS[day](np.random.default_rng(0), 1))
+    for phase, phase_usage in usage.items():
+        sites = "\n".join(f"  {site}: {size} bytes" for site, size in phase_usage.sites)
+        assert phase_usage.peak <= budget, f"{phase} peaked at {phase_usage.peak} bytes, top allocations:\n{sites}"
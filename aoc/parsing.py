@@ -0,0 +1,93 @@
+from collections.abc import Buffer
+
+import numpy as np
+
+# integers with more digits than this don't fit into an int64
+MAX_DIGITS = 18
+
+NEWLINE = ord("\n")
+WHITESPACE = frozenset(b" \t\r\n")
+
+
+def as_buffer(data: str | Buffer) -> np.ndarray:
+    return np.frombuffer(data.encode() if isinstance(data, str) else data, dtype=np.uint8)
+
+
+def find_ints(buffer: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Find all (non-negative) integers in a buffer of ascii characters, as if finding all runs of digits with a regex
+
+    Returns:
+        The integers, and the position in the buffer at which each of them starts
+    """
+    digits = buffer - ord("0")  # wraps around for characters before "0", so those are >= 10 as well
+    is_digit = np.concatenate([[False], digits < 10, [False]])
+    # positions where a run of digits starts, and the positions right after each run ends
+    starts, ends = np.flatnonzero(~is_digit[:-1] & is_digit[1:]), np.flatnonzero(is_digit[:-1] & ~is_digit[1:])
+    if len(starts) > 0 and (ends - starts).max() > MAX_DIGITS:
+        raise ValueError(f"Integers with more than {MAX_DIGITS} digits don't fit into an int64")
+
+    # Horner's method over all integers at once: add one more digit to all integers which have one at a time
+    lengths = ends - starts
+    values = np.zeros(len(starts), dtype=np.int64)
+    for i in range(int(lengths.max(initial=0))):
+        has_digit = lengths > i
+        values = np.where(has_digit, values * 10 + digits[np.where(has_digit, starts + i, 0)], values)
+    return values, starts
+
+
+def extract_ints(data: str | Buffer) -> np.ndarray:
+    """Extract all integers in the input at once, as a flat int64 array"""
+    values, _ = find_ints(as_buffer(data))
+    return values
+
+
+def extract_int_rows(data: str | Buffer) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Extract all integers in the input, grouped by line. Trailing empty lines are ignored.
+
+    Returns:
+        All integers as a flat int64 array, and the offsets at which each line starts, with the integers of line i at
+        values[offsets[i] : offsets[i + 1]]
+    """
+    buffer = as_buffer(data)
+    values, starts = find_ints(buffer)
+    newlines = np.flatnonzero(buffer == NEWLINE)
+    end = len(buffer)
+    while end > 0 and buffer[end - 1] in WHITESPACE:
+        end -= 1
+    num_lines = int(np.searchsorted(newlines, end)) + 1 if end > 0 else 0
+    # integers before the i-th newline belong to the lines before it
+    offsets = np.searchsorted(starts, np.concatenate([[0], newlines[: num_lines - 1] + 1, [len(buffer)]]))
+    return values, offsets
+
+
+def extract_int_table(data: str | Buffer, columns: int | None = None) -> np.ndarray:
+    """
+    Extract all integers in the input into a 2D array. Without a given number of columns, every line becomes a row, so
+    all lines need to contain the same number of integers.
+    """
+    if columns is not None:
+        values = extract_ints(data)
+        if len(values) % columns != 0:
+            raise ValueError(f"Can't split {len(values)} integers into rows of {columns}")
+        return values.reshape(-1, columns)
+
+    values, offsets = extract_int_rows(data)
+    counts = np.unique(np.diff(offsets))
+    if len(counts) > 1:
+        raise ValueError(f"Lines contain different numbers of integers: {counts.tolist()}")
+    return values.reshape(len(offsets) - 1, int(counts[0]) if len(counts) > 0 else 0)
+
+
+def test_extract_ints() -> None:
+    assert extract_ints("Button A: X+94, Y+34\nPrize: X=8400, Y=5400").tolist() == [94, 34, 8400, 5400]
+    assert extract_ints(b"007 and 123456789012345678").tolist() == [7, 123456789012345678]
+    assert extract_ints("no numbers").tolist() == []
+
+    values, offsets = extract_int_rows("7 6 4 2 1\n1 2\n\n9\n\n")
+    assert values.tolist() == [7, 6, 4, 2, 1, 1, 2, 9]
+    assert offsets.tolist() == [0, 5, 7, 7, 8]
+
+    assert extract_int_table("3   4\n4   3\n2   5\n").tolist() == [[3, 4], [4, 3], [2, 5]]
+    assert extract_int_table("1, 2\n3\n4\n\n5, 6", columns=3).tolist() == [[1, 2, 3], [4, 5, 6]]
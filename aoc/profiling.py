@@ -0,0 +1,177 @@
+"""
+Opt-in profiling of the parse, part1 and part2 entry points of every day. Profiling is enabled by setting the
+AOC_PROFILE environment variable to a directory (or by `python -m aoc --profile DIR`) before the days are imported.
+Profiles of every profiled function are written to that directory:
+
+- <module>.<function>.prof: cProfile stats, for pstats or snakeviz
+- <module>.<function>.collapsed: collapsed stacks, for flamegraph tools like flamegraph.pl or speedscope
+- <module>.<function>.calls.json: call counts of hot functions, either those named in AOC_PROFILE_FUNCTIONS
+  (separated by commas) or all functions of the aoc package
+
+When disabled, the decorator returns functions unchanged, so there is no cost at all.
+"""
+
+import cProfile
+import functools
+import json
+import os
+import pstats
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, TypeAlias, TypeVar
+
+import pytest
+
+PROFILE_ENV = "AOC_PROFILE"
+FUNCTIONS_ENV = "AOC_PROFILE_FUNCTIONS"
+
+F = TypeVar("F", bound=Callable[..., Any])
+# a function in pstats: (file name, line number, function name)
+Function: TypeAlias = tuple[str, int, str]
+
+# profilers of all profiled functions, which accumulate stats over repeated calls
+profilers: dict[str, cProfile.Profile] = {}
+# names of the profiles currently being recorded, only the outermost one of nested profiled calls records anything
+active: list[str] = []
+
+
+def profile_directory() -> Path | None:
+    directory = os.environ.get(PROFILE_ENV)
+    return Path(directory) if directory else None
+
+
+@contextmanager
+def profile(name: str) -> Iterator[None]:
+    """Profile a block of code, if profiling is enabled, writing all profiles of the given name afterwards"""
+    directory = profile_directory()
+    if directory is None or active:
+        yield
+        return
+
+    profiler = profilers.setdefault(name, cProfile.Profile())
+    active.append(name)
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        active.pop()
+        write_profiles(pstats.Stats(profiler), directory, name)
+
+
+def profiled(function: F) -> F:
+    """Decorator profiling every call of a function, if profiling is enabled when the function is defined"""
+    directory = profile_directory()
+    if directory is None:
+        return function
+
+    name = f"{function.__module__}.{function.__name__}"
+
+    @functools.wraps(function)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        if active:
+            return function(*args, **kwargs)
+        # unlike the profile context manager, runcall keeps the profiler itself out of the recorded stacks
+        profiler = profilers.setdefault(name, cProfile.Profile())
+        active.append(name)
+        try:
+            return profiler.runcall(function, *args, **kwargs)
+        finally:
+            active.pop()
+            write_profiles(pstats.Stats(profiler), directory, name, root=code_location(function))
+
+    return wrapper  # type: ignore[return-value]
+
+
+def code_location(function: Callable[..., Any]) -> Function:
+    code = function.__code__
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def write_profiles(stats: pstats.Stats, directory: Path, name: str, root: Function | None = None) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    stats.dump_stats(directory / f"{name}.prof")
+    stacks = collapse(stats, root)
+    (directory / f"{name}.collapsed").write_text("".join(f"{stack} {count}\n" for stack, count in stacks))
+    functions = os.environ.get(FUNCTIONS_ENV)
+    counts = call_counts(stats, functions.split(",") if functions else None)
+    (directory / f"{name}.calls.json").write_text(json.dumps(counts, indent=2) + "\n")
+
+
+def label(function: Function) -> str:
+    file_name, line, name = function
+    return name if line == 0 else f"{Path(file_name).stem}:{name}:{line}"  # line 0 is used for builtins
+
+
+def collapse(stats: pstats.Stats, root: Function | None = None) -> list[tuple[str, int]]:
+    """
+    Convert cProfile stats into collapsed stacks (semicolon separated frames with a sample count, in microseconds).
+
+    cProfile only records the time spent in every caller -> callee edge, not full stacks, so stacks are reconstructed
+    by walking the call graph from its roots, splitting the time of every function among its callers in proportion
+    to the cumulative time spent in the function when called from each caller. The roots are the given function, or
+    all functions without callers.
+    """
+    raw: dict[Function, tuple[int, int, float, float, dict[Function, tuple]]] = stats.stats  # type: ignore[attr-defined]
+    callees: dict[Function, list[tuple[Function, float]]] = {}
+    for function, (*_, callers) in raw.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((function, edge[3]))
+
+    stacks: dict[str, int] = {}
+
+    def walk(function: Function, stack: tuple[str, ...], share: float) -> None:
+        _, _, own_time, cumulative, _ = raw[function]
+        stack = (*stack, label(function))
+        if (microseconds := round(own_time * share * 1e6)) > 0:
+            key = ";".join(stack)
+            stacks[key] = stacks.get(key, 0) + microseconds
+        for callee, edge_time in callees.get(function, []):
+            if callee in raw and label(callee) not in stack and cumulative > 0:  # don't follow recursion
+                walk(callee, stack, share * edge_time / raw[callee][3] if raw[callee][3] > 0 else 0)
+
+    roots = (
+        [root]
+        if root is not None and root in raw
+        else [function for function, (*_, callers) in raw.items() if not callers]
+    )
+    for function in roots:
+        walk(function, (), 1)
+    return sorted(stacks.items())
+
+
+def call_counts(stats: pstats.Stats, names: list[str] | None = None) -> dict[str, int]:
+    """
+    Count how often functions were called (including recursive calls), for the functions with the given names, or all
+    functions of the aoc package
+    """
+    raw: dict[Function, tuple[int, int, float, float, dict]] = stats.stats  # type: ignore[attr-defined]
+    package = Path(__file__).parent
+    counts: dict[str, int] = {}
+    for (file_name, _, name), (_, calls, *_) in raw.items():
+        if file_name == __file__ and name == "wrapper":  # the profiling wrappers themselves
+            continue
+        if (name in names) if names is not None else Path(file_name).parent == package:
+            counts[name] = counts.get(name, 0) + calls
+    return dict(sorted(counts.items(), key=lambda item: -item[1]))
+
+
+def test_profiled(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    def fib(n: int) -> int:
+        return n if n < 2 else fib(n - 1) + fib(n - 2)
+
+    assert profiled(fib) is fib  # profiling is disabled by default
+
+    monkeypatch.setenv(PROFILE_ENV, str(tmp_path))
+    monkeypatch.setenv(FUNCTIONS_ENV, "fib")
+    profiled_fib = profiled(fib)
+    assert profiled_fib(10) == 55
+    name = f"{__name__}.fib"
+    assert json.loads((tmp_path / f"{name}.calls.json").read_text()) == {"fib": 177}
+    assert pstats.Stats(str(tmp_path / f"{name}.prof")).total_calls > 0  # type: ignore[attr-defined]
+    stacks = dict(line.rsplit(" ", 1) for line in (tmp_path / f"{name}.collapsed").read_text().splitlines())
+    assert all(stack.startswith("profiling:fib:") for stack in stacks)
+
+    # nested calls of profiled functions are recorded as part of the outermost one
+    assert profiled(lambda: profiled_fib(5))() == 5
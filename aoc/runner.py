@@ -0,0 +1,72 @@
+"""Discover the solutions of all days, and run them while timing each phase"""
+
+import importlib
+import pkgutil
+import re
+import time
+from collections.abc import Callable
+from statistics import median
+from types import ModuleType
+from typing import Any
+
+import aoc
+
+DAY_MODULE = re.compile(r"day(\d+)")
+PARTS = ("part1", "part2")
+
+
+def discover_days() -> dict[int, str]:
+    """Find all dayNN modules of the aoc package, by their day"""
+    return {
+        int(match[1]): f"{aoc.__name__}.{module.name}"
+        for module in pkgutil.iter_modules(aoc.__path__)
+        if (match := DAY_MODULE.fullmatch(module.name))
+    }
+
+
+def load_day(day: int) -> ModuleType:
+    days = discover_days()
+    if day not in days:
+        raise ValueError(f"There is no solution for day {day}, available days: {sorted(days)}")
+    return importlib.import_module(days[day])
+
+
+def time_calls(function: Callable[..., Any], *args: Any, repeat: int = 1, warmup: int = 0) -> tuple[Any, list[float]]:
+    """
+    Call a function warmup + repeat times, timing each of the repeated calls
+
+    Returns:
+        The result of the last call, and the wall time of each timed call in seconds
+    """
+    for _ in range(warmup):
+        function(*args)
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter() - start)
+    return result, times
+
+
+def summarize(times: list[float]) -> dict[str, Any]:
+    return {"times": times, "min": min(times), "median": median(times), "max": max(times)}
+
+
+def run_day(day: int, data: str, repeat: int = 1, warmup: int = 0) -> dict[str, Any]:
+    """Run parse, part1 and part2 of a day on the given input, and time each of them"""
+    module = load_day(day)
+    puzzle_input, parse_times = time_calls(module.parse, data, repeat=repeat, warmup=warmup)
+    # the puzzle input is passed on just like in the tests, where tuples are splat into the arguments of the parts
+    args = puzzle_input if isinstance(puzzle_input, tuple) else (puzzle_input,)
+
+    phases = {"parse": summarize(parse_times)}
+    for part in PARTS:
+        result, times = time_calls(getattr(module, part), *args, repeat=repeat, warmup=warmup)
+        phases[part] = {"result": result, **summarize(times)}
+    return {"day": day, "module": module.__name__, "repeat": repeat, "warmup": warmup, "phases": phases}
+
+
+def to_json(value: Any) -> Any:
+    """Convert results which are not natively serializable, such as numpy integers"""
+    return value.item() if hasattr(value, "item") else str(value)